@@ -0,0 +1,94 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prettypercentiles import get_percentiles  # noqa: E402
+
+
+def parse_args(args):
+    """
+    Parses the arguments of the percentile benchmark
+    Arguments:
+        args: Program arguments, excluding first argument (filename being executed)
+    Returns: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark of sort based versus selection based percentiles")
+    parser.add_argument(
+        "-s",
+        "--sizes",
+        type=float,
+        nargs="+",
+        default=[1e6, 1e8, 1e9],
+        help="Amount of samples to benchmark (10^9 needs about 16GB of memory)",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=3,
+        help="Amount of repetitions per size, the fastest one is reported",
+    )
+    return parser.parse_args(args)
+
+
+def sort_percentiles(latencies, percentages):
+    """
+    The previous implementation: full sort followed by np.percentile
+    """
+    sorted_np = np.sort(np.array(latencies))
+    return np.percentile(sorted_np, percentages)
+
+
+def best_time(func, repeat):
+    """
+    Runs func repeat times
+    Returns: The fastest wall time in seconds
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(args):
+    params = parse_args(args)
+
+    # Sample points for 4 intervals, same as the example configs
+    sample_points = [15.0, 30.0, 50.0, 60.0, 70.0, 80.0, 90.0]
+    percentages = sample_points.copy()
+    for i in range(1, 4):
+        final_point = percentages[-1]
+        percentages.extend([final_point + j/(10.0 ** i) for j in sample_points])
+
+    rng = np.random.default_rng(42)
+    print(f"{'samples':>12} {'sort (s)':>10} {'select (s)':>11} {'in place (s)':>13} {'speedup':>8}")
+    for size in params.sizes:
+        n = int(size)
+        latencies = rng.lognormal(1.0, 1.0, n)
+
+        sort_time = best_time(
+            lambda: sort_percentiles(latencies, percentages), params.repeat)
+        select_time = best_time(
+            lambda: get_percentiles(latencies, percentages), params.repeat)
+
+        # The copy is made outside of the timed section, partitioning an already partitioned array is not representative
+        in_place_time = float('inf')
+        for _ in range(params.repeat):
+            work = latencies.copy()
+            start = time.perf_counter()
+            get_percentiles(work, percentages, overwrite_input=True)
+            in_place_time = min(in_place_time, time.perf_counter() - start)
+            del work
+
+        print(f"{n:>12} {sort_time:>10.3f} {select_time:>11.3f} {in_place_time:>13.3f} {sort_time / in_place_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
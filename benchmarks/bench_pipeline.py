@@ -0,0 +1,321 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import types
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from csv_loader import npy_filename  # noqa: E402
+from customfunctions import convert_nanos_to_millis  # noqa: E402
+from hdr_histogram import HdrHistogram  # noqa: E402
+from prettypercentiles import compute_series, get_sample_points, render  # noqa: E402
+from profiler import Profiler  # noqa: E402
+
+# Columns of the generated csv files
+COLUMNS = ('timestamp', 'lognormal', 'pareto')
+# Stages of the profile (see profiler.py) that are reported, in pipeline order
+STAGES = ('load', 'preprocess', 'combine', 'percentiles', 'hgrm', 'render')
+# Inputs the pipeline is benchmarked on
+CASES = ('csv', 'npy', 'hgrm')
+# Rows generated and written at a time, bounds the memory of generating big datasets
+CHUNK_ROWS = 1_000_000
+
+
+def parse_args(args):
+    """
+    Parses the arguments of the pipeline benchmark
+    Arguments:
+        args: Program arguments, excluding first argument (filename being executed)
+    Returns: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="End to end benchmark of the pipeline on synthetic heavy tailed latency data")
+    parser.add_argument(
+        "-s",
+        "--sizes",
+        type=float,
+        nargs="+",
+        default=[1e5, 1e6, 1e7],
+        help="Amount of rows of the generated datasets (10^9 rows is about 30GB of csv and needs 16GB of memory)",
+    )
+    parser.add_argument(
+        "--cases",
+        type=str,
+        nargs="+",
+        choices=CASES,
+        default=list(CASES),
+        help="Inputs to benchmark: csv columns, converted .npy columns and a .hgrm histogram",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=3,
+        help="Amount of repetitions per case, the fastest time of every stage is reported",
+    )
+    parser.add_argument(
+        "--data-dir",
+        type=str,
+        default=os.path.join(ROOT, '.bench_data'),
+        help="Directory of the generated datasets, which are reused by later runs",
+    )
+    parser.add_argument(
+        "--no-render",
+        action="store_true",
+        help="Don't render the plot, only the data path is benchmarked",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="File to store the results in (default benchmarks/results/<git commit>.json)",
+    )
+    parser.add_argument(
+        "--compare",
+        type=str,
+        help="Results file of an earlier version to compare with, exits with code 1 on a regression",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Relative slowdown of a stage that counts as a regression in --compare",
+    )
+    parser.add_argument(
+        "--min-seconds",
+        type=float,
+        default=0.05,
+        help="Stages faster than this in both runs are not compared, they are dominated by noise",
+    )
+    return parser.parse_args(args)
+
+
+def dataset_filenames(data_dir, rows):
+    """
+    Arguments:
+        data_dir: Directory of the generated datasets
+        rows: Amount of rows of the dataset
+    Returns: Dict with the name of the 'csv' file, the .npy file per column under 'npy' and the 'hgrm' file
+    """
+    csv_file = os.path.join(data_dir, f'latency_{rows}.csv')
+    return {'csv': csv_file,
+            'npy': {column: npy_filename(csv_file, column) for column in COLUMNS},
+            'hgrm': os.path.join(data_dir, f'latency_{rows}.hgrm')}
+
+
+def generate_dataset(data_dir, rows, seed=42):
+    """
+    Generates a dataset of heavy tailed latencies if it doesn't exist yet. The csv file has a timestamp column
+    in seconds, a lognormal column in milliseconds and a Pareto column in nanoseconds (so it gets preprocessed).
+    The same values are written as one .npy file per column and the lognormal column as a .hgrm histogram.
+    Arguments:
+        data_dir: Directory to write the dataset to
+        rows: Amount of rows
+        seed: Seed of the random generator, the same seed always gives the same dataset
+    Returns: The file names of the dataset (see dataset_filenames)
+    """
+    filenames = dataset_filenames(data_dir, rows)
+    if all(os.path.exists(filename) for filename in
+           [filenames['csv'], filenames['hgrm']] + list(filenames['npy'].values())):
+        return filenames
+    os.makedirs(data_dir, exist_ok=True)
+    print(f'Generating {rows} rows in {data_dir}')
+    rng = np.random.default_rng(seed)
+    histogram = HdrHistogram(3, unit_ratio=1000)
+    npy_files = {column: np.lib.format.open_memmap(f'{filename}.tmp', mode='w+', dtype=np.float64, shape=(rows,))
+                 for column, filename in filenames['npy'].items()}
+    with open(f"{filenames['csv']}.tmp", 'w') as f:
+        f.write(','.join(COLUMNS) + '\n')
+        for start in range(0, rows, CHUNK_ROWS):
+            count = min(CHUNK_ROWS, rows - start)
+            chunk = {
+                # 1000 requests per second
+                'timestamp': np.arange(start, start + count) / 1000.0,
+                'lognormal': np.round(rng.lognormal(1.0, 0.75, count), 3),
+                # Pareto with a heavy tail, minimum of 1ms in nanoseconds
+                'pareto': np.round((rng.pareto(1.5, count) + 1.0) * 1e6),
+            }
+            np.savetxt(f, np.column_stack([chunk[column] for column in COLUMNS]),
+                       fmt=['%.3f', '%.3f', '%.0f'], delimiter=',')
+            for column, values in chunk.items():
+                npy_files[column][start:start + count] = values
+            histogram.add(chunk['lognormal'])
+    for column, array in npy_files.items():
+        array.flush()
+        del array
+        os.replace(f"{filenames['npy'][column]}.tmp", filenames['npy'][column])
+    os.replace(f"{filenames['csv']}.tmp", filenames['csv'])
+    histogram.write_hgrm(filenames['hgrm'])
+    return filenames
+
+
+def benchmark_config(case, filenames, plot_filename):
+    """
+    Arguments:
+        case: One of CASES
+        filenames: The file names of the dataset (see dataset_filenames)
+        plot_filename: File name of the rendered plot
+    Returns: Config object with the same attributes as a config module.
+    The csv and npy cases load two columns, preprocess one and combine both, the hgrm case reads the histogram.
+    """
+    if case == 'csv':
+        lognormal = (filenames['csv'], 'lognormal')
+        pareto = (filenames['csv'], 'pareto', convert_nanos_to_millis)
+    else:
+        lognormal = (filenames['npy']['lognormal'], 'lognormal')
+        pareto = (filenames['npy']['pareto'], 'pareto', convert_nanos_to_millis)
+    label_map = {}
+    combined_columns = {}
+    hgrm_map = {}
+    if case == 'hgrm':
+        hgrm_map['lognormal'] = filenames['hgrm']
+    else:
+        label_map = {'lognormal': lognormal, 'pareto': pareto}
+        combined_columns = {'lognormal+pareto': (sum, [lognormal, pareto])}
+    return types.SimpleNamespace(
+        title=f'Benchmark {case}', file_name=plot_filename, num_intervals=6, y_log=True,
+        x_axis_label='Percentile', y_axis_label='Latency (ms)', font_scale=1, dark_mode=False,
+        output_formats=['png'], dpi=100, label_map=label_map, combined_columns=combined_columns,
+        hgrm_map=hgrm_map, label_line={})
+
+
+def run_case(config, rendered):
+    """
+    Runs the pipeline once without cache
+    Arguments:
+        config: Config object (see benchmark_config)
+        rendered: Whether to render the plot
+    Returns: Dict where key = stage (see STAGES) or 'total', value = wall time in seconds
+    """
+    profiler = Profiler()
+    profiler.start()
+    try:
+        start = time.perf_counter()
+        np_sample_points = get_sample_points(config.num_intervals)
+        (perc_map, percentage_map, annotations, window_map) = compute_series(
+            config, np_sample_points)
+        if len(perc_map) != len(config.label_map) + len(config.combined_columns) + len(config.hgrm_map):
+            raise RuntimeError(f'Not all series of {config.title} could be computed')
+        if rendered:
+            render(config, np_sample_points, perc_map, percentage_map, annotations, window_map,
+                   {'formats': config.output_formats, 'dpi': config.dpi, 'max_points': 500, 'timing': False})
+        total = time.perf_counter() - start
+    finally:
+        profiler.stop()
+    times = {stage: 0.0 for stage in STAGES}
+    for record in profiler.spans:
+        # Only the outermost span of a stage counts, nested spans of the same stage are part of it
+        if record['stage'] in times and record['depth'] == min(
+                other['depth'] for other in profiler.spans if other['stage'] == record['stage']):
+            times[record['stage']] += record['duration']
+    times['total'] = total
+    return times
+
+
+def git_commit():
+    """
+    Returns: Short hash of the checked out commit with '-dirty' if there are changes, or 'unknown' outside of git
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, check=True,
+                                capture_output=True, text=True).stdout.strip()
+        changes = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT, check=True,
+                                 capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f'{commit}-dirty' if changes else commit
+
+
+def result_key(result):
+    return (result['rows'], result['case'])
+
+
+def compare(results, rendered, baseline, tolerance, min_seconds):
+    """
+    Prints the ratio of every stage compared to the baseline
+    Arguments:
+        results: List of results of this run
+        rendered: Whether this run rendered the plots
+        baseline: Stored results of an earlier run (see main)
+        tolerance: Relative slowdown that counts as a regression
+        min_seconds: Stages faster than this in both runs are skipped
+    Returns: List of strings describing the regressions
+    """
+    baseline_results = {result_key(result): result for result in baseline['results']}
+    # Render time is only comparable if both runs rendered, or both didn't
+    skipped = () if baseline['meta']['rendered'] == rendered else ('render', 'total')
+    regressions = []
+    print(f"Compared to {baseline['meta']['commit']} (ratio > 1 is slower):")
+    for result in results:
+        old = baseline_results.get(result_key(result))
+        if old is None:
+            continue
+        ratios = []
+        for stage, seconds in result['seconds'].items():
+            old_seconds = old['seconds'].get(stage)
+            if stage in skipped or old_seconds is None or max(seconds, old_seconds) < min_seconds:
+                continue
+            ratio = seconds / max(old_seconds, 1e-9)
+            ratios.append(f'{stage} {ratio:.2f}')
+            if ratio > 1 + tolerance:
+                regressions.append(f"{result['case']} {result['rows']} rows {stage}: "
+                                   f"{old_seconds:.3f}s -> {seconds:.3f}s")
+        print(f"{result['rows']:>12} {result['case']:>5}  " + ', '.join(ratios))
+    return regressions
+
+
+def main(args):
+    params = parse_args(args)
+    commit = git_commit()
+    results = []
+    print(f"{'rows':>12} {'case':>5} " + ' '.join(f'{stage:>11}' for stage in STAGES + ('total',))
+          + f" {'Mrows/s':>8}")
+    warmed_up = False
+    for size in params.sizes:
+        rows = int(size)
+        filenames = generate_dataset(params.data_dir, rows)
+        for case in params.cases:
+            config = benchmark_config(case, filenames,
+                                      os.path.join(params.data_dir, f'plot_{rows}_{case}.png'))
+            if not warmed_up:
+                # The first run pays for lazy imports and first calls into numpy, which later runs don't
+                run_case(config, not params.no_render)
+                warmed_up = True
+            best = None
+            for _ in range(params.repeat):
+                times = run_case(config, not params.no_render)
+                best = times if best is None else {stage: min(best[stage], times[stage]) for stage in best}
+            results.append({'rows': rows, 'case': case, 'seconds': best})
+            print(f'{rows:>12} {case:>5} ' + ' '.join(f'{best[stage]:>11.3f}' for stage in STAGES + ('total',))
+                  + f" {rows / best['total'] / 1e6:>8.2f}")
+
+    output = params.output or os.path.join(ROOT, 'benchmarks', 'results', f'{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'meta': {'commit': commit, 'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                            'python': platform.python_version(), 'numpy': np.__version__,
+                            'platform': platform.platform(), 'cpus': os.cpu_count(),
+                            'repeat': params.repeat, 'rendered': not params.no_render},
+                   'results': results}, f, indent=2)
+    print(f'Results written to {output}')
+
+    if params.compare:
+        with open(params.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, not params.no_render, baseline, params.tolerance, params.min_seconds)
+        if regressions:
+            print('Regressions:')
+            for regression in regressions:
+                print(f'  {regression}')
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
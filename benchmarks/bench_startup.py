@@ -0,0 +1,113 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules of the plotting stack, which only runs that render a figure may import
+PLOTTING_MODULES = ('matplotlib', 'seaborn', 'pandas', 'scipy')
+
+
+def parse_args(args):
+    """
+    Parses the arguments of the startup benchmark
+    Arguments:
+        args: Program arguments, excluding first argument (filename being executed)
+    Returns: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark of the startup time of the cli for runs that don't plot")
+    parser.add_argument(
+        "-c",
+        "--config",
+        type=str,
+        default="configs.example_config",
+        help="The config used for the export only run",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=5,
+        help="Amount of repetitions per command, the fastest one is reported",
+    )
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        default=0.5,
+        help="Fail (exit code 1) if --help takes longer than this, guards against eager imports creeping back",
+    )
+    return parser.parse_args(args)
+
+
+def best_time(command, repeat):
+    """
+    Runs command repeat times in a new process from the repository root
+    Returns: The fastest wall time in seconds
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=ROOT, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def imported_plotting_modules(args):
+    """
+    Runs the cli in a new process
+    Arguments:
+        args: Arguments of the cli
+    Returns: List of the plotting modules that were imported by the run
+    """
+    code = ('import sys\n'
+            'import prettypercentiles\n'
+            f'prettypercentiles.main({args!r})\n'
+            f'print("imported:", *(m for m in {PLOTTING_MODULES!r} if m in sys.modules))\n')
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True,
+                            capture_output=True, text=True)
+    line = [line for line in result.stdout.splitlines() if line.startswith('imported:')][-1]
+    return line.split()[1:]
+
+
+def main(args):
+    params = parse_args(args)
+    export_file = os.path.join(ROOT, '.bench_startup_export.json')
+    export_args = ['-c', params.config, '--no-cache',
+                   '--no-plot', '--export', export_file]
+
+    commands = {
+        'python': [sys.executable, '-c', 'pass'],
+        'import numpy': [sys.executable, '-c', 'import numpy'],
+        '--help': [sys.executable, 'prettypercentiles.py', '--help'],
+        'export only': [sys.executable, 'prettypercentiles.py'] + export_args,
+        'import plotting': [sys.executable, '-c', 'import plotting'],
+    }
+    try:
+        print(f"{'command':>16} {'time (s)':>9}")
+        times = {}
+        for name, command in commands.items():
+            times[name] = best_time(command, params.repeat)
+            print(f"{name:>16} {times[name]:>9.3f}")
+
+        plotting_modules = imported_plotting_modules(export_args)
+    finally:
+        if os.path.exists(export_file):
+            os.remove(export_file)
+
+    failed = False
+    if plotting_modules:
+        print(f"export only run imported {', '.join(plotting_modules)}")
+        failed = True
+    if times['--help'] > params.max_seconds:
+        print(f"--help took {times['--help']:.3f}s, more than {params.max_seconds}s")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
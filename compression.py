@@ -0,0 +1,172 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+import queue
+import threading
+
+# Read buffer of input files, compressed or not
+READ_BUFFER_BYTES = 1024 * 1024
+
+# Decompressed bytes per block handed from the decompression thread to the reader
+BLOCK_BYTES = 1024 * 1024
+
+# Amount of blocks the decompression thread may run ahead of the reader
+QUEUE_BLOCKS = 8
+
+
+def open_zstd(filename):
+    """
+    Opens a zstandard compressed file, needs the zstandard package
+    Args:
+        filename: Name of the .zst file
+    Returns:
+        Binary file object with the decompressed data
+    """
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(
+            'Reading .zst files needs zstandard, install it with: pip install zstandard') from None
+    return zstandard.ZstdDecompressor().stream_reader(
+        open(filename, 'rb', buffering=READ_BUFFER_BYTES), closefd=True)
+
+
+# Dict where key = file extension, value = function that opens the file as a decompressed binary stream
+CODECS = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+    '.zst': open_zstd,
+}
+
+
+def compression(filename):
+    """
+    Args:
+        filename: Name of a file
+    Returns:
+        Extension of the compression of the file (e.g. '.gz'), or None if it is not compressed
+    """
+    extension = os.path.splitext(filename)[1]
+    return extension if extension in CODECS else None
+
+
+def strip_compression(filename):
+    """
+    Args:
+        filename: Name of a file
+    Returns:
+        The file name without compression extension, e.g. data.csv for data.csv.gz
+    """
+    extension = compression(filename)
+    return filename if extension is None else filename[:-len(extension)]
+
+
+class ThreadedReader(io.RawIOBase):
+    """
+    Raw binary stream that reads a decompressing file object in a background thread, so decompression overlaps
+    with parsing. zlib, bz2, lzma and zstandard release the GIL while they decompress.
+    """
+
+    def __init__(self, fileobj, block_bytes=BLOCK_BYTES, queue_blocks=QUEUE_BLOCKS):
+        """
+        Args:
+            fileobj: Binary file object that decompresses while it is read, closed together with the reader
+            block_bytes: Decompressed bytes per block
+            queue_blocks: Amount of blocks that are decompressed ahead of the reader
+        """
+        super().__init__()
+        self._file = fileobj
+        self._queue = queue.Queue(queue_blocks)
+        self._block = memoryview(b'')
+        self._offset = 0
+        self._position = 0
+        self._eof = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._decompress, args=(block_bytes,), daemon=True)
+        self._thread.start()
+
+    def _decompress(self, block_bytes):
+        try:
+            while not self._stop.is_set():
+                block = self._file.read(block_bytes)
+                self._put(block)
+                if not block:
+                    return
+        except BaseException as e:
+            # Raised in the reading thread instead
+            self._put(e)
+
+    def _put(self, item):
+        # Wait for room in the queue, unless the reader gets closed in the meantime
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._offset == len(self._block):
+            if self._eof:
+                return 0
+            item = self._queue.get()
+            if isinstance(item, BaseException):
+                raise item
+            if not item:
+                self._eof = True
+                return 0
+            self._block = memoryview(item)
+            self._offset = 0
+        size = min(len(buffer), len(self._block) - self._offset)
+        buffer[:size] = self._block[self._offset:self._offset + size]
+        self._offset += size
+        self._position += size
+        return size
+
+    def tell(self):
+        """
+        Returns:
+            Amount of decompressed bytes read so far
+        """
+        return self._position
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self._file.close()
+        super().close()
+
+
+def open_binary(filename):
+    """
+    Opens a file for reading bytes with a large read buffer, files with a compression extension
+    (.gz, .bz2, .xz, .zst) are decompressed in a background thread while they are read
+    Args:
+        filename: Name of the file
+    Returns:
+        Binary file object, only plain files can seek
+    """
+    extension = compression(filename)
+    if extension is None:
+        return open(filename, 'rb', buffering=READ_BUFFER_BYTES)
+    return io.BufferedReader(ThreadedReader(CODECS[extension](filename)), READ_BUFFER_BYTES)
+
+
+def open_text(filename):
+    """
+    Opens a text file for reading, decompressed like open_binary
+    Args:
+        filename: Name of the file
+    Returns:
+        Text file object
+    """
+    if compression(filename) is None:
+        return open(filename, 'r', buffering=READ_BUFFER_BYTES)
+    return io.TextIOWrapper(open_binary(filename), encoding='utf-8')
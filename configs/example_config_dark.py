@@ -45,6 +45,20 @@ The output plot image filename (directories in the path must already exist other
 """
 file_name = 'images/example_plot_dark.png'
 
+"""
+Optional list: output_formats
+Formats to write the plot in (png, svg, pdf, etc.), all from the same figure. The extension of file_name is
+replaced by each format. Defaults to the format of the file_name extension.
+Optional int: dpi
+Resolution of png output, defaults to 600
+Optional int: max_points
+Maximum amount of points per line, longer lines are thinned evenly over the percentile axis
+keeping the extreme tail and the maximum, defaults to 500
+"""
+# output_formats = ['png', 'svg']
+# dpi = 300
+# max_points = 200
+
 """
 Int: num_intervals
 Amount of intervals to display
@@ -55,9 +69,22 @@ Must be at least 1
 num_intervals = 4
 
 """
-tuple: (csv filename, column name, optional preprocessing function)
+tuple: (csv filename, column name, optional preprocessing function, optional dict of options)
 Information that defines a column in a csv file and optionally a preprocessing function that it needs to go through.
 The csv should consist of a header in the first line which define column names and data below it
+The csv file may be compressed (.gz, .bz2, .xz or .zst), it is then decompressed while it is read
+Options (only for columns in the label_map):
+    'sketch': relative accuracy (e.g. 0.01 for 1%), estimates the percentiles with a streaming quantile sketch
+              instead of keeping the whole column in memory. The achieved error is shown in the legend.
+    'hdr': significant digits (0-5), records the column into a HdrHistogram instead of keeping it in memory
+    'unit_ratio': (with 'hdr') histogram values are integers, values are multiplied by this first to keep decimals
+    'hgrm_out': (with 'hdr') file name to write the histogram to as .hgrm, which can be used in the hgrm_map later
+    'timestamp': name of a timestamp column, with 'window' the percentiles are computed per time window
+    'window': size of a time window in the unit of the timestamp column
+    'window_plot': 'over_time' (default) plots the windows over time in <file_name>_over_time.png, 'lines' plots a line per window
+The 'dtype' option also works for columns of combined_columns:
+    'dtype': type the column is kept in memory as instead of float64, e.g. 'uint32' (half the memory) or 'int64'
+             for integer nanoseconds, 'float32' for decimals. The series fails if a value doesn't fit the type exactly.
 """
 # This is just random data ranging from 1 - 50 (representing millisecond times for example)
 source_csv = 'data/example_data.csv'
@@ -69,11 +96,22 @@ column2 = (source_csv, 'column2')
 # Here we take the column nanosecond_times but preprocess it first using a custom function (see customfunctions.py)
 millisecond_times = (other_source_csv, 'nanosecond_times',
                      convert_nanos_to_millis)
+# The same column estimated with a quantile sketch within 1% relative error, for files that don't fit in memory
+# millisecond_times_sketch = (other_source_csv, 'nanosecond_times', convert_nanos_to_millis, {'sketch': 0.01})
+# The nanoseconds are integers, so they can be kept in memory as uint32 instead of float64
+# millisecond_times_compact = (other_source_csv, 'nanosecond_times', convert_nanos_to_millis, {'dtype': 'uint32'})
 
 """
 Dict: hgrm_map
 Where: Key = label in plot
-       Value = File name of .hgrm file (output from hdrhistogram tool)
+       Value = File name of .hgrm file (output from hdrhistogram tool) or .hlog interval log,
+               either may be compressed (.gz, .bz2, .xz or .zst),
+               a glob pattern or list of those to merge their histograms,
+               or tuple of (any of those, dict of options), options for .hlog files:
+               'start', 'end': only merge intervals starting within [start, end) seconds
+               'tag': only merge intervals with this tag
+               'unit_ratio': divide the recorded values by this, for example 1000000 for ns to ms
+               'significant_digits': significant digits of merged .hgrm files (default 3)
 """
 hgrm_map = {}
 hgrm_map['hgrm latencies'] = "data/hdrhistogram_example.hgrm"
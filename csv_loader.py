@@ -0,0 +1,447 @@
+import copy
+import csv
+import os
+import shutil
+import concurrent.futures
+
+import numpy as np
+from compression import compression, open_binary, strip_compression
+from profiler import span
+
+# Amount of text read from the csv file per chunk, bounds the parsing memory independent of file size
+DEFAULT_CHUNK_BYTES = 16 * 1024 * 1024
+
+# Amount of rows per chunk when streaming binary columns
+DEFAULT_CHUNK_ROWS = 1024 * 1024
+
+
+class ColumnBuffer:
+    """
+    Growable numpy buffer that column chunks get appended to
+    """
+
+    def __init__(self, capacity=0, dtype=np.float64):
+        """
+        Args:
+            capacity: Initial amount of elements to reserve
+            dtype: Numpy dtype of the elements
+        """
+        self._data = np.empty(capacity, dtype=dtype)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def dtype(self):
+        return self._data.dtype
+
+    def reserve(self, capacity):
+        """
+        Makes sure the buffer can hold at least capacity elements without growing
+        Args:
+            capacity: Amount of elements to reserve
+        """
+        if capacity > len(self._data):
+            data = np.empty(capacity, dtype=self._data.dtype)
+            data[:self._size] = self._data[:self._size]
+            self._data = data
+
+    def add(self, chunk):
+        """
+        Appends a chunk of values to the buffer
+        Args:
+            chunk: numpy array with the values to append
+        """
+        end = self._size + len(chunk)
+        if end > len(self._data):
+            # Grow by 25% so the overallocation stays small for huge columns
+            self.reserve(max(end, len(self._data) + len(self._data) // 4))
+        self._data[self._size:end] = chunk
+        self._size = end
+
+    def array(self):
+        """
+        Returns:
+            numpy array view of the values in the buffer (no copy)
+        """
+        return self._data[:self._size]
+
+
+def read_header(f):
+    """
+    Reads the header line of an opened csv file
+    Args:
+        f: File object (binary) positioned at the start of the csv file
+    Returns:
+        List of column names
+    """
+    return next(csv.reader([f.readline().decode('utf-8-sig')]), [])
+
+
+def read_csv_header(csv_file):
+    """
+    Args:
+        csv_file: Name of the (compressed) csv file
+    Returns:
+        List of column names
+    """
+    with open_binary(csv_file) as f:
+        return read_header(f)
+
+
+def column_indices(header, columns):
+    """
+    Args:
+        header: List of column names in the csv file
+        columns: List of column names to extract
+    Returns:
+        List with the index of each column in the header
+    """
+    indices = []
+    for column in columns:
+        if column not in header:
+            raise KeyError(column)
+        indices.append(header.index(column))
+    return indices
+
+
+def iter_csv_chunks(csv_file, columns, chunk_bytes=DEFAULT_CHUNK_BYTES, start=None, end=None):
+    """
+    Streams columns of a csv file in chunks of bounded size
+    Only the requested columns are parsed, the others are skipped by the parser.
+    Args:
+        csv_file: Name of the csv file
+        columns: List of column names to extract
+        chunk_bytes: Approximate amount of text to parse per chunk
+        start: Optional byte offset of a line start to begin at, defaults to the line after the header
+        end: Optional byte offset of a line start to stop at, defaults to the end of the file.
+        Offsets are positions in the decompressed text, compressed files (see compression.py) can't seek
+        so they are always read from the start.
+    Yields:
+        Dict where key = column name, value = numpy float64 array with the values of the chunk
+    """
+    with open_binary(csv_file) as f:
+        indices = column_indices(read_header(f), columns)
+        if start is not None:
+            f.seek(start)
+        position = f.tell()
+        while end is None or position < end:
+            limit = chunk_bytes if end is None else min(
+                chunk_bytes, end - position)
+            # Whole lines only, a range end is always a line start so it is never read past.
+            # readlines keeps reading until the hint is exceeded, so stay one byte below the limit
+            lines = f.readlines(limit - 1) if limit > 1 else [f.readline()]
+            if not lines or not lines[0]:
+                break
+            position += sum(len(line) for line in lines)
+            data = np.loadtxt(lines, delimiter=',', quotechar='"', usecols=indices,
+                              dtype=np.float64, ndmin=2, encoding='utf-8')
+            yield {column: data[:, i] for i, column in enumerate(columns)}
+
+
+def split_byte_ranges(csv_file, parts):
+    """
+    Splits the data rows of a csv file into byte ranges that start and end at line boundaries
+    Args:
+        csv_file: Name of the csv file
+        parts: Amount of ranges to split into
+    Returns:
+        List of tuples of (start, end) byte offsets in row order, empty ranges are left out
+    """
+    size = os.path.getsize(csv_file)
+    with open(csv_file, 'rb') as f:
+        f.readline()
+        data_start = f.tell()
+        bounds = [data_start]
+        for i in range(1, parts):
+            position = data_start + (size - data_start) * i // parts
+            # Move to the start of the next line, staying put if position already is a line start
+            f.seek(max(position - 1, data_start))
+            if position > data_start:
+                f.readline()
+            bounds.append(max(f.tell(), bounds[-1]))
+        bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+class DtypeError(ValueError):
+    """
+    Raised when the values of a column don't fit in the dtype it is stored as
+    """
+
+    def __init__(self, column, dtype):
+        """
+        Args:
+            column: Column name
+            dtype: numpy dtype the values don't fit in
+        """
+        super().__init__(column, dtype)
+        self.column = column
+        self.dtype = dtype
+
+    def __str__(self):
+        return f'Values of column {self.column} do not fit in {self.dtype}'
+
+
+def check_dtype(values, dtype, column):
+    """
+    Checks that parsed values can be stored in a column of the given dtype without changing them
+    Args:
+        values: numpy array with parsed values
+        dtype: numpy dtype the values are stored as
+        column: Column name, for the error message
+    Raises:
+        DtypeError: If an integer dtype can't hold a value exactly (fractions, negative values for unsigned types,
+        values out of range or NaN)
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind not in 'iu' or len(values) == 0:
+        return
+    info = np.iinfo(dtype)
+    if not (info.min <= values.min() and values.max() <= info.max and np.array_equal(values, np.trunc(values))):
+        raise DtypeError(column, dtype)
+
+
+def consumer_columns(column):
+    """
+    Args:
+        column: Column of a consumer, a column name or tuple of (column name, timestamp column name)
+    Returns:
+        Tuple of the column names the sink of the consumer is given, the first one is preprocessed
+    """
+    return (column,) if isinstance(column, str) else tuple(column)
+
+
+def parse_csv_range(csv_file, columns, consumers=(), chunk_bytes=DEFAULT_CHUNK_BYTES, start=None, end=None,
+                    dtypes=None):
+    """
+    Parses a (byte range of a) csv file, keeping some columns in memory and streaming others into sinks
+    Args:
+        csv_file: Name of the csv file
+        columns: List of column names to keep in memory
+        consumers: List of tuples of (column name, sink, preprocessing function or None),
+        every chunk of the column is preprocessed and added to the sink (e.g. a quantile sketch).
+        The column name can also be a tuple of (column name, timestamp column name), the sink then gets
+        the chunk of the timestamp column as well (see consumer_columns)
+        chunk_bytes: Approximate amount of text to parse per chunk
+        start: Optional byte offset to begin at (see iter_csv_chunks)
+        end: Optional byte offset to stop at (see iter_csv_chunks)
+        dtypes: Optional dict where key = column name, value = numpy dtype the column is stored as (default float64).
+        Values are parsed as float64 first, so integers are exact up to 2^53.
+    Returns:
+        Tuple of 1. dict where key = column name, value = numpy array with the (range of the) column,
+        2. list of the sinks in the same order as consumers
+    """
+    if dtypes is None:
+        dtypes = {}
+    buffers = {column: ColumnBuffer(dtype=dtypes.get(column) or np.float64) for column in columns}
+    parsed_columns = list(buffers)
+    for column, _, _ in consumers:
+        for name in consumer_columns(column):
+            if name not in parsed_columns:
+                parsed_columns.append(name)
+
+    # The size of a compressed file is the amount of compressed bytes read, it doesn't tell the amount of rows
+    compressed = compression(csv_file) is not None
+    range_bytes = (os.path.getsize(csv_file) if end is None else end) - (start or 0)
+    with span('parse', csv_file, rows=0, nbytes=range_bytes) as record:
+        for chunk in iter_csv_chunks(csv_file, parsed_columns, chunk_bytes, start, end):
+            record['rows'] += len(chunk[parsed_columns[0]]) if parsed_columns else 0
+            for column, buffer in buffers.items():
+                values = chunk[column]
+                check_dtype(values, buffer.dtype, column)
+                if len(buffer) == 0 and not compressed:
+                    # Reserve the estimated column length once so the buffer rarely has to grow
+                    parsed_bytes = min(chunk_bytes, range_bytes)
+                    buffer.reserve(int(range_bytes / max(parsed_bytes, 1) * len(values) * 1.02) + 1)
+                buffer.add(values)
+            for column, sink, func in consumers:
+                names = consumer_columns(column)
+                values = chunk[names[0]]
+                sink.add(values if func is None else np.asarray(func(values)),
+                         *(chunk[name] for name in names[1:]))
+    return {column: buffer.array() for column, buffer in buffers.items()}, [sink for _, sink, _ in consumers]
+
+
+def load_csv_columns(csv_file, columns, consumers=(), chunk_bytes=DEFAULT_CHUNK_BYTES, workers=1, dtypes=None):
+    """
+    Loads columns of a csv file into numpy arrays, reading the file in chunks
+    Args:
+        csv_file: Name of the csv file
+        columns: List of column names to keep in memory
+        consumers: List of tuples of (column name, sink, preprocessing function or None),
+        every chunk of the column is preprocessed and added to the sink instead of being kept (see parse_csv_range)
+        chunk_bytes: Approximate amount of text to parse per chunk
+        workers: Amount of processes that parse byte ranges of the file in parallel.
+        Sinks must have a merge method then, and preprocessing functions must be picklable (module level functions).
+        Compressed files can't be split into byte ranges, they are parsed by this process while a background thread
+        decompresses them (see compression.py).
+        dtypes: Optional dict where key = column name, value = numpy dtype the column is stored as (see parse_csv_range)
+    Returns:
+        Dict where key = column name, value = numpy array with the whole column, rows in file order
+    """
+    if workers <= 1 or compression(csv_file) is not None:
+        return parse_csv_range(csv_file, columns, consumers, chunk_bytes, dtypes=dtypes)[0]
+
+    ranges = split_byte_ranges(csv_file, workers)
+    # Every worker gets its own empty copy of the sinks, they are merged afterwards
+    empty_consumers = [(column, copy.deepcopy(sink), func)
+                       for column, sink, func in consumers]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(parse_csv_range, csv_file, columns, empty_consumers, chunk_bytes, start, end, dtypes)
+                   for start, end in ranges]
+        parts = [future.result() for future in futures]
+
+    result = {}
+    for column in columns:
+        # Ranges are concatenated in file order, so rows stay aligned with the other columns and files
+        buffer = ColumnBuffer(sum(len(part[0][column]) for part in parts), parts[0][0][column].dtype)
+        for part in parts:
+            buffer.add(part[0][column])
+        result[column] = buffer.array()
+    for i, (_, sink, _) in enumerate(consumers):
+        for part in parts:
+            sink.merge(part[1][i])
+    return result
+
+
+def complete_lines_end(csv_file, start):
+    """
+    Args:
+        csv_file: Name of the csv file
+        start: Byte offset of a line start
+    Returns:
+        Byte offset just past the last newline after start, so a line that is still being written is left out,
+        or start if there is no complete line after it
+    """
+    with open(csv_file, 'rb') as f:
+        position = f.seek(0, os.SEEK_END)
+        # Search backwards block by block, usually the last block already holds a newline
+        while position > start:
+            block_start = max(start, position - 64 * 1024)
+            f.seek(block_start)
+            newline = f.read(position - block_start).rfind(b'\n')
+            if newline >= 0:
+                return block_start + newline + 1
+            position = block_start
+    return start
+
+
+def follow_csv(csv_file, consumers, offset=None, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    Adds the rows appended to a growing csv file since a previous call to the sinks of the consumers
+    Args:
+        csv_file: Name of the csv file
+        consumers: List of tuples of (column name, sink, preprocessing function or None) (see parse_csv_range)
+        offset: Byte offset returned by the previous call, None to start after the header
+        chunk_bytes: Approximate amount of text to parse per chunk
+    Returns:
+        Byte offset up to which the file is processed, pass it to the next call
+    """
+    if compression(csv_file) is not None:
+        raise ValueError(f'{csv_file} is compressed, only plain csv files can be followed')
+    if offset is None:
+        with open(csv_file, 'rb') as f:
+            f.readline()
+            offset = f.tell()
+    end = complete_lines_end(csv_file, offset)
+    if end > offset:
+        parse_csv_range(csv_file, [], consumers, chunk_bytes, offset, end)
+    return end
+
+
+def load_npy_columns(npy_file, columns, consumers=(), chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Loads a column that was converted to a .npy file (see convert_csv), memory mapped so nothing is copied or parsed
+    Args:
+        npy_file: Name of the .npy file
+        columns: List of column names to keep, they all refer to the single column in the file
+        consumers: List of tuples of (column name, sink, preprocessing function or None) (see parse_csv_range)
+        chunk_rows: Amount of rows added to the sinks at once
+    Returns:
+        Dict where key = column name, value = memory mapped numpy array of the column
+    """
+    array = np.load(npy_file, mmap_mode='r')
+    for column, sink, func in consumers:
+        if len(consumer_columns(column)) > 1:
+            raise ValueError(
+                f'{npy_file} holds a single column, timestamp windows need the csv file')
+        for start in range(0, len(array), chunk_rows):
+            values = array[start:start + chunk_rows]
+            sink.add(values if func is None else np.asarray(func(values)))
+    return {column: array for column in columns}
+
+
+def load_columns_from_file(filename, columns, consumers=(), chunk_bytes=DEFAULT_CHUNK_BYTES, workers=1, dtypes=None):
+    """
+    Loads columns from a (compressed) csv file or a converted .npy column file, picked by file extension
+    Args: See load_csv_columns, dtypes don't apply to .npy files, which keep the dtype they were converted to
+    Returns:
+        Dict where key = column name, value = numpy array with the whole column
+    """
+    if filename.endswith('.npy'):
+        return load_npy_columns(filename, columns, consumers)
+    return load_csv_columns(filename, columns, consumers, chunk_bytes, workers, dtypes)
+
+
+def npy_filename(csv_file, column, output_dir=None):
+    """
+    Args:
+        csv_file: Name of the csv file
+        column: Column name
+        output_dir: Optional directory, defaults to the directory of the csv file
+    Returns:
+        Name of the .npy file a column gets converted to, e.g. data/example_data.column1.npy
+        (for data/example_data.csv or data/example_data.csv.gz)
+    """
+    directory, name = os.path.split(strip_compression(csv_file))
+    if output_dir is not None:
+        directory = output_dir
+    stem = name[:-len('.csv')] if name.endswith('.csv') else name
+    return os.path.join(directory, f'{stem}.{column}.npy')
+
+
+def convert_csv(csv_file, columns=None, output_dir=None, chunk_bytes=DEFAULT_CHUNK_BYTES, dtype=np.float64):
+    """
+    Converts columns of a csv file to one .npy file per column in a single streaming pass
+    Args:
+        csv_file: Name of the csv file
+        columns: Optional list of columns to convert, defaults to all columns
+        output_dir: Optional directory to write to, defaults to the directory of the csv file
+        chunk_bytes: Approximate amount of text to parse per chunk
+        dtype: numpy dtype of the .npy files, e.g. uint32 for integer nanoseconds (see check_dtype)
+    Returns:
+        Dict where key = column name, value = name of the written .npy file
+    """
+    if columns is None:
+        columns = read_csv_header(csv_file)
+    filenames = {column: npy_filename(csv_file, column, output_dir)
+                 for column in columns}
+    dtype = np.dtype(dtype)
+
+    # The amount of rows is only known at the end, so the raw values are written to temporary files first
+    raw_files = {column: open(f'{filename}.tmp', 'wb')
+                 for column, filename in filenames.items()}
+    rows = 0
+    try:
+        for chunk in iter_csv_chunks(csv_file, columns, chunk_bytes):
+            for column, values in chunk.items():
+                check_dtype(values, dtype, column)
+                raw_files[column].write(
+                    np.ascontiguousarray(values, dtype=dtype).tobytes())
+            rows += len(next(iter(chunk.values())))
+    finally:
+        for raw_file in raw_files.values():
+            raw_file.close()
+
+    for column, filename in filenames.items():
+        with open(filename, 'wb') as out, open(f'{filename}.tmp', 'rb') as raw:
+            np.lib.format.write_array_header_1_0(out, {
+                'descr': np.lib.format.dtype_to_descr(dtype),
+                'fortran_order': False,
+                'shape': (rows,),
+            })
+            shutil.copyfileobj(raw, out, DEFAULT_CHUNK_BYTES)
+        os.remove(f'{filename}.tmp')
+    return filenames
@@ -1,7 +1,39 @@
+import numpy as np
+
+
+def vectorized(func):
+    """
+    Marks a combination function as vectorized.
+    Vectorized combination functions get the list of column arrays at once and return one array,
+    unmarked functions are called once per row with the elements at that row (slow compatibility path).
+    """
+    func.vectorized = True
+    return func
+
+
+def reduce_columns(ufunc, columns, dtype=None):
+    """
+    Reduces equally sized columns into one array using a numpy ufunc, without stacking them in memory
+    Arguments:
+        ufunc: Binary numpy ufunc such as np.add or np.maximum
+        columns: List of numpy arrays
+        dtype: Optional dtype of the result, defaults to the common dtype of the columns
+    Returns: numpy array with the reduced columns
+    """
+    if dtype is None:
+        dtype = np.result_type(*columns)
+    result = np.array(columns[0], dtype=dtype)
+    for column in columns[1:]:
+        ufunc(result, column, out=result)
+    return result
+
+
 def convert_nanos_to_millis(column):
-    return [i/1000000 for i in column]
+    return np.asarray(column) / 1000000
 
 
-def avg(sequence):
-    total = sum(sequence)
-    return total/len(sequence)
\ No newline at end of file
+@vectorized
+def avg(columns):
+    total = reduce_columns(np.add, columns, dtype=np.float64)
+    total /= len(columns)
+    return total
@@ -0,0 +1,108 @@
+import csv
+import json
+import os
+
+import numpy as np
+
+# Columns of the exported table, window_start is empty for series without time windows
+TABLE_COLUMNS = ('label', 'window_start', 'percentage', 'percentile')
+
+
+def series_rows(perc_map, percentage_map, window_map):
+    """
+    Args:
+        perc_map: Dict where key = label, value = percentiles (a row per window for windowed series)
+        percentage_map: Dict where key = label, value = percentages
+        window_map: Dict where key = label, value = numpy array with the start of every window
+    Yields:
+        Tuples of (label, window start or None, percentage, percentile), one per point in label order
+    """
+    for label, percentiles in perc_map.items():
+        percentages = np.asarray(percentage_map[label], dtype=np.float64).tolist()
+        if label in window_map:
+            for start, row in zip(np.asarray(window_map[label]).tolist(), np.asarray(percentiles).tolist()):
+                for percentage, percentile in zip(percentages, row):
+                    yield label, start, percentage, percentile
+        else:
+            for percentage, percentile in zip(percentages, np.asarray(percentiles, dtype=np.float64).tolist()):
+                yield label, None, percentage, percentile
+
+
+def write_json(filename, perc_map, percentage_map, annotations, window_map):
+    """
+    Writes the series as a JSON object where key = label, value = object with 'percentages', 'percentiles'
+    (a list per window for windowed series), and the optional 'window_starts' and 'annotation'
+    Args:
+        filename: Name of the .json file
+        perc_map, percentage_map, annotations, window_map: Computed series (see export_series)
+    """
+    series = {}
+    for label, percentiles in perc_map.items():
+        entry = {'percentages': np.asarray(percentage_map[label], dtype=np.float64).tolist(),
+                 'percentiles': np.asarray(percentiles, dtype=np.float64).tolist()}
+        if label in window_map:
+            entry['window_starts'] = np.asarray(window_map[label]).tolist()
+        if label in annotations:
+            entry['annotation'] = annotations[label]
+        series[label] = entry
+    with open(filename, 'w') as f:
+        json.dump(series, f, indent=2)
+
+
+def write_csv(filename, perc_map, percentage_map, window_map):
+    """
+    Writes the series as a csv table with a row per point, see TABLE_COLUMNS
+    Args:
+        filename: Name of the .csv file
+        perc_map, percentage_map, window_map: Computed series (see export_series)
+    """
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(TABLE_COLUMNS)
+        for label, start, percentage, percentile in series_rows(perc_map, percentage_map, window_map):
+            writer.writerow((label, '' if start is None else start,
+                             repr(percentage), repr(percentile)))
+
+
+def write_parquet(filename, perc_map, percentage_map, window_map):
+    """
+    Writes the series as a Parquet table with a row per point, see TABLE_COLUMNS. Needs pyarrow.
+    Args:
+        filename: Name of the .parquet file
+        perc_map, percentage_map, window_map: Computed series (see export_series)
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError(
+            'Exporting to Parquet needs pyarrow, install it with: pip install pyarrow') from None
+    rows = list(series_rows(perc_map, percentage_map, window_map))
+    table = pa.table({column: [row[i] for row in rows] for i, column in enumerate(TABLE_COLUMNS)},
+                     schema=pa.schema([('label', pa.string()), ('window_start', pa.float64()),
+                                       ('percentage', pa.float64()), ('percentile', pa.float64())]))
+    pq.write_table(table, filename)
+
+
+def export_series(filename, perc_map, percentage_map, annotations=None, window_map=None):
+    """
+    Writes the computed percentiles to a file, the format is picked by extension (.json, .csv or .parquet)
+    Args:
+        filename: Name of the file to write
+        perc_map: Dict where key = label, value = percentiles (a row per window for windowed series)
+        percentage_map: Dict where key = label, value = percentages
+        annotations: Optional dict where key = label, value = legend annotation (e.g. the error of a sketch)
+        window_map: Optional dict where key = label, value = numpy array with the start of every window
+    """
+    annotations = annotations or {}
+    window_map = window_map or {}
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.json':
+        write_json(filename, perc_map, percentage_map, annotations, window_map)
+    elif extension == '.csv':
+        write_csv(filename, perc_map, percentage_map, window_map)
+    elif extension == '.parquet':
+        write_parquet(filename, perc_map, percentage_map, window_map)
+    else:
+        raise ValueError(
+            f'Unknown export format {extension}, use .json, .csv or .parquet')
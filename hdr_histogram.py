@@ -0,0 +1,540 @@
+import base64
+import copy
+import math
+import struct
+import zlib
+
+import numpy as np
+
+from compression import open_text
+
+
+class HdrHistogram:
+    """
+    Numpy backed HdrHistogram (log-linear buckets), with the same bucket layout as the HdrHistogram library.
+    Values are recorded as integers, every recorded value is kept within significant_digits of precision.
+    Memory only depends on the range of the values, not on the amount of values, and the counts array grows
+    to whatever highest value is recorded.
+    """
+
+    def __init__(self, significant_digits=3, lowest_discernible_value=1, unit_ratio=1.0):
+        """
+        Args:
+            significant_digits: Amount of significant decimal digits to keep (range 0-5)
+            lowest_discernible_value: Smallest integer value that can be told apart from 0
+            unit_ratio: Integer units per value, values are multiplied by it before being rounded and recorded
+            and divided by it again when read. E.g. 1000 to keep 3 decimals of millisecond values.
+        """
+        if not 0 <= significant_digits <= 5:
+            raise ValueError(
+                f'significant_digits must be between 0 and 5, got {significant_digits}')
+        if lowest_discernible_value < 1:
+            raise ValueError(
+                f'lowest_discernible_value must be at least 1, got {lowest_discernible_value}')
+        self.significant_digits = significant_digits
+        self.lowest_discernible_value = lowest_discernible_value
+        self.unit_ratio = unit_ratio
+
+        largest_single_unit_resolution = 2 * 10 ** significant_digits
+        sub_bucket_count_magnitude = math.ceil(
+            math.log2(largest_single_unit_resolution))
+        self.sub_bucket_half_count_magnitude = max(
+            sub_bucket_count_magnitude, 1) - 1
+        self.unit_magnitude = int(math.floor(
+            math.log2(lowest_discernible_value)))
+        self.sub_bucket_count = 1 << (self.sub_bucket_half_count_magnitude + 1)
+        self.sub_bucket_half_count = self.sub_bucket_count // 2
+        self.sub_bucket_mask = (self.sub_bucket_count -
+                                1) << self.unit_magnitude
+
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.total_count = 0
+        self.min_value = None
+        self.max_value = 0
+
+    def _counts_indices(self, values):
+        """
+        Args:
+            values: numpy int64 array of non negative integer values
+        Returns:
+            numpy int64 array with the index into the counts array of each value
+        """
+        # Bit length of value | mask, float64 is exact for integers below 2^53
+        bit_lengths = np.frexp(
+            (values | self.sub_bucket_mask).astype(np.float64))[1]
+        bucket_indices = bit_lengths - \
+            (self.unit_magnitude + self.sub_bucket_half_count_magnitude + 1)
+        sub_bucket_indices = values >> (bucket_indices + self.unit_magnitude)
+        return ((bucket_indices + 1).astype(np.int64) << self.sub_bucket_half_count_magnitude) + \
+            (sub_bucket_indices - self.sub_bucket_half_count)
+
+    def _index_bounds(self, indices):
+        """
+        Args:
+            indices: numpy array of indices into the counts array
+        Returns:
+            Tuple of numpy arrays with 1. the lowest and 2. the highest integer value that is counted at each index
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        bucket_indices = (indices >> self.sub_bucket_half_count_magnitude) - 1
+        sub_bucket_indices = (indices & (self.sub_bucket_half_count - 1)) + \
+            self.sub_bucket_half_count
+        first_bucket = bucket_indices < 0
+        sub_bucket_indices = np.where(
+            first_bucket, sub_bucket_indices - self.sub_bucket_half_count, sub_bucket_indices)
+        bucket_indices = np.where(first_bucket, 0, bucket_indices)
+        lowest = sub_bucket_indices << (bucket_indices + self.unit_magnitude)
+        highest = lowest + (1 << (bucket_indices + self.unit_magnitude)) - 1
+        return lowest, highest
+
+    def _grow(self, length):
+        if length > len(self.counts):
+            counts = np.zeros(length, dtype=np.int64)
+            counts[:len(self.counts)] = self.counts
+            self.counts = counts
+
+    def add_integers(self, values, counts=None):
+        """
+        Records integer values (already multiplied by unit_ratio)
+        Args:
+            values: numpy array of non negative integer values
+            counts: Optional numpy array with the amount of times each value is recorded, defaults to once
+        """
+        values = np.asarray(values, dtype=np.int64).reshape(-1)
+        if len(values) == 0:
+            return
+        if values.min() < 0:
+            raise ValueError('Cannot record negative values in a HdrHistogram')
+        if values.max() >= 1 << 53:
+            raise ValueError('Cannot record values of 2^53 or larger in a HdrHistogram')
+        indices = self._counts_indices(values)
+        self._grow(int(indices.max()) + 1)
+        self.counts += np.bincount(indices, weights=counts,
+                                   minlength=len(self.counts)).astype(np.int64)
+
+        if counts is not None:
+            values = values[np.asarray(counts) > 0]
+            if len(values) == 0:
+                return
+            self.total_count += int(np.sum(counts))
+        else:
+            self.total_count += len(values)
+        low = int(values.min())
+        self.min_value = low if self.min_value is None else min(
+            self.min_value, low)
+        self.max_value = max(self.max_value, int(values.max()))
+
+    def add(self, values):
+        """
+        Records values, e.g. the chunks of a column
+        Args:
+            values: numpy array of non negative values
+        """
+        values = np.asarray(values, dtype=np.float64).reshape(-1)
+        if np.isnan(values).any():
+            raise ValueError('Cannot record NaN values in a HdrHistogram')
+        self.add_integers(np.rint(values * self.unit_ratio))
+
+    def add_counts(self, counts):
+        """
+        Adds counts per counts index, e.g. decoded from the binary encoding
+        Args:
+            counts: numpy int64 array of counts, indexed like the counts of this histogram
+        """
+        nonzero = np.flatnonzero(counts)
+        if len(nonzero) == 0:
+            return
+        self._grow(len(counts))
+        self.counts[:len(counts)] += counts
+        self.total_count += int(counts.sum())
+        lowest, _ = self._index_bounds(nonzero[[0, -1]])
+        self.min_value = int(lowest[0]) if self.min_value is None else min(
+            self.min_value, int(lowest[0]))
+        self.max_value = max(self.max_value, int(lowest[1]))
+
+    def merge(self, other):
+        """
+        Adds the counts of another histogram to this one
+        Args:
+            other: HdrHistogram with the same significant digits, lowest discernible value and unit ratio
+        """
+        if (other.sub_bucket_count, other.unit_magnitude, other.unit_ratio) != \
+                (self.sub_bucket_count, self.unit_magnitude, self.unit_ratio):
+            raise ValueError('Cannot merge HdrHistograms with a different layout')
+        if other.total_count == 0:
+            return
+        self._grow(len(other.counts))
+        self.counts[:len(other.counts)] += other.counts
+        self.total_count += other.total_count
+        self.min_value = other.min_value if self.min_value is None else min(
+            self.min_value, other.min_value)
+        self.max_value = max(self.max_value, other.max_value)
+
+    def integer_percentiles(self, percentages):
+        """
+        Gets the recorded integer values at the given percentages, like getValueAtPercentile of HdrHistogram
+        Args:
+            percentages: List of percentages (0-100)
+        Returns:
+            Tuple of numpy arrays with 1. the integer values, 2. the lowest integer value of their bucket
+        """
+        if self.total_count == 0:
+            raise ValueError('Cannot get percentiles of an empty HdrHistogram')
+        percentages = np.clip(np.nextafter(np.asarray(percentages, dtype=np.float64), -np.inf),
+                              0.0, 100.0)
+        counts_at_percentiles = np.maximum(
+            np.ceil(percentages / 100.0 * self.total_count), 1)
+        indices = np.searchsorted(
+            np.cumsum(self.counts), counts_at_percentiles, side='left')
+        lowest, highest = self._index_bounds(indices)
+        return np.where(percentages == 0.0, lowest, highest), lowest
+
+    def percentiles(self, percentages):
+        """
+        Gets the percentiles of all recorded values
+        Args:
+            percentages: List of percentages (0-100) to get the percentiles for
+        Returns:
+            Tuple of 1. numpy array of the percentiles,
+            2. numpy array of the relative error bound of each percentile (bucket width relative to the value)
+        """
+        values, lowest = self.integer_percentiles(percentages)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            errors = np.where(values > 0, (values - lowest) / values, 0.0)
+        return values / self.unit_ratio, errors
+
+    def _distribution(self, ticks_per_half_distance):
+        """
+        Iterates the percentile levels the same way as the HdrHistogram percentile output
+        Returns:
+            Tuple of numpy arrays with 1. the integer values, 2. the percentile levels, 3. the total counts
+        """
+        nonzero = np.flatnonzero(self.counts)
+        cumulative = np.cumsum(self.counts)[nonzero]
+        current_percentiles = 100.0 * cumulative / self.total_count
+
+        levels = []
+        positions = []
+        level = 0.0
+        while True:
+            position = int(np.searchsorted(
+                current_percentiles, level, side='left'))
+            levels.append(level)
+            positions.append(position)
+            if position == len(nonzero) - 1:
+                break
+            ticks = ticks_per_half_distance * \
+                2 ** (int(math.log(100.0 / (100.0 - level)) / math.log(2)) + 1)
+            level += 100.0 / ticks
+        # One additional last step to 100%
+        levels.append(100.0)
+        positions.append(len(nonzero) - 1)
+
+        positions = np.array(positions)
+        _, highest = self._index_bounds(nonzero[positions])
+        return highest, np.array(levels), cumulative[positions]
+
+    def write_hgrm(self, filename, ticks_per_half_distance=5):
+        """
+        Writes the percentile distribution in the .hgrm text format of HdrHistogram, which parse_hgrm can read
+        Args:
+            filename: Name of the .hgrm file to write
+            ticks_per_half_distance: Amount of percentile rows per halving of the distance to 100%
+        """
+        if self.total_count == 0:
+            raise ValueError('Cannot write an empty HdrHistogram')
+        digits = self.significant_digits
+        values, levels, total_counts = self._distribution(
+            ticks_per_half_distance)
+
+        # Statistics use the middle of each bucket, like HdrHistogram
+        nonzero = np.flatnonzero(self.counts)
+        lowest, highest = self._index_bounds(nonzero)
+        medians = (lowest + (highest - lowest + 1) // 2).astype(np.float64)
+        counts = self.counts[nonzero]
+        mean = np.sum(medians * counts) / self.total_count
+        std_deviation = math.sqrt(
+            np.sum((medians - mean) ** 2 * counts) / self.total_count)
+        max_value = self._index_bounds(self._counts_indices(
+            np.array([self.max_value])))[1][0] if self.max_value else 0
+        buckets = max(int(nonzero[-1]) >> self.sub_bucket_half_count_magnitude, 1)
+
+        with open(filename, 'w') as f:
+            f.write('%12s %14s %10s %14s\n\n' %
+                    ('Value', 'Percentile', 'TotalCount', '1/(1-Percentile)'))
+            for value, level, total_count in zip(values[:-1], levels[:-1], total_counts[:-1]):
+                f.write(f'{value / self.unit_ratio:12.{digits}f} {level / 100.0:2.12f} '
+                        f'{total_count:10d} {1.0 / (1.0 - level / 100.0):14.2f}\n')
+            f.write(f'{values[-1] / self.unit_ratio:12.{digits}f} {levels[-1] / 100.0:2.12f} '
+                    f'{total_counts[-1]:10d}\n')
+            f.write(f'#[Mean    = {mean / self.unit_ratio:12.{digits}f}, '
+                    f'StdDeviation   = {std_deviation / self.unit_ratio:12.{digits}f}]\n')
+            f.write(f'#[Max     = {max_value / self.unit_ratio:12.{digits}f}, '
+                    f'Total count    = {self.total_count:12d}]\n')
+            f.write(f'#[Buckets = {buckets:12d}, SubBuckets     = {self.sub_bucket_count:12d}]\n')
+
+
+class WindowedHistograms:
+    """
+    One HdrHistogram per time window, values are assigned to a window by their timestamp.
+    Windows are aligned to multiples of the window size, so histograms of different parts of a file can be merged.
+    """
+
+    def __init__(self, window, significant_digits=3, unit_ratio=1.0):
+        """
+        Args:
+            window: Size of a window in the unit of the timestamps
+            significant_digits: Significant digits of the histogram of every window (see HdrHistogram)
+            unit_ratio: Unit ratio of the histogram of every window (see HdrHistogram)
+        """
+        if window <= 0:
+            raise ValueError(f'window must be positive, got {window}')
+        self.window = window
+        self.significant_digits = significant_digits
+        self.unit_ratio = unit_ratio
+        # Dict where key = window index (timestamp // window), value = HdrHistogram
+        self.histograms = {}
+
+    def add(self, values, timestamps):
+        """
+        Records values into the histogram of their window
+        Args:
+            values: numpy array of non negative values
+            timestamps: numpy array of the timestamp of each value
+        """
+        values = np.asarray(values, dtype=np.float64).reshape(-1)
+        timestamps = np.asarray(timestamps, dtype=np.float64).reshape(-1)
+        if len(values) != len(timestamps):
+            raise ValueError('Every value needs a timestamp')
+        if len(values) == 0:
+            return
+        windows, inverse = np.unique(
+            np.floor(timestamps / self.window).astype(np.int64), return_inverse=True)
+        # Group the values per window with one stable sort instead of a mask per window
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.searchsorted(inverse[order], np.arange(len(windows) + 1))
+        for i, window in enumerate(windows.tolist()):
+            histogram = self.histograms.get(window)
+            if histogram is None:
+                histogram = HdrHistogram(self.significant_digits, unit_ratio=self.unit_ratio)
+                self.histograms[window] = histogram
+            histogram.add(values[order[bounds[i]:bounds[i + 1]]])
+
+    def merge(self, other):
+        """
+        Merges the histograms of another WindowedHistograms with the same window size window by window
+        """
+        if other.window != self.window:
+            raise ValueError('Cannot merge windowed histograms with a different window size')
+        for window, histogram in other.histograms.items():
+            if window in self.histograms:
+                self.histograms[window].merge(histogram)
+            else:
+                self.histograms[window] = copy.deepcopy(histogram)
+
+    def starts(self):
+        """
+        Returns:
+            numpy array with the start of every window that has values, relative to the start of the first one
+        """
+        windows = np.array(sorted(self.histograms), dtype=np.int64)
+        return (windows - windows[:1]) * self.window
+
+    def percentiles(self, percentages):
+        """
+        Gets the percentiles of every window, in the order of starts
+        Args:
+            percentages: List of percentages (0-100) to get the percentiles for
+        Returns:
+            Tuple of 2D numpy arrays with a row per window of 1. the percentiles,
+            2. the relative error bounds (see HdrHistogram.percentiles)
+        """
+        if not self.histograms:
+            raise ValueError('Cannot get percentiles of empty windowed histograms')
+        results = [self.histograms[window].percentiles(percentages)
+                   for window in sorted(self.histograms)]
+        return np.array([values for values, _ in results]), np.array([errors for _, errors in results])
+
+
+# Cookies of the V2 HdrHistogram encoding, the bits 4-7 hold the word size and are masked out
+V2_ENCODING_COOKIE = 0x1c849303
+V2_COMPRESSED_ENCODING_COOKIE = 0x1c849304
+COOKIE_WORD_SIZE_MASK = ~0xf0
+# Size of the header of the uncompressed V2 encoding in bytes
+V2_HEADER_SIZE = 40
+
+# Interval timestamps more than this before the StartTime of a .hlog file are relative, as in HistogramLogReader
+YEAR_SECONDS = 365 * 24 * 3600.0
+
+
+def decode_zigzag_leb128(payload):
+    """
+    Decodes the counts payload of the V2 encoding: ZigZag LEB128 varints where positive values are counts
+    and negative values are runs of zero counts
+    Args:
+        payload: bytes of the payload
+    Returns:
+        numpy int64 array of counts
+    """
+    data = np.frombuffer(payload, dtype=np.uint8)
+    if len(data) == 0:
+        return np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    lengths = ends - starts + 1
+    if len(ends) == 0 or ends[-1] != len(data) - 1 or lengths.max() > 8:
+        # Truncated payloads or 9 byte varints (counts of 2^56 and up) are decoded one by one
+        values = decode_varints_slow(payload)
+    else:
+        data = data[:ends[-1] + 1]
+        shifts = 7 * (np.arange(len(data)) - np.repeat(starts, lengths))
+        parts = (data & 0x7f).astype(np.uint64) << shifts.astype(np.uint64)
+        values = np.add.reduceat(parts, starts)
+    # ZigZag decoding
+    values = (values >> np.uint64(1)).astype(np.int64) ^ - \
+        (values & np.uint64(1)).astype(np.int64)
+
+    widths = np.where(values < 0, -values, 1)
+    positions = np.cumsum(widths) - widths
+    counts = np.zeros(int(widths.sum()), dtype=np.int64)
+    positive = values > 0
+    counts[positions[positive]] = values[positive]
+    return counts
+
+
+def decode_varints_slow(payload):
+    """
+    Decodes LEB128 varints one by one, the 9th byte of a varint holds 8 bits
+    Args:
+        payload: bytes of the payload
+    Returns:
+        numpy uint64 array of the (still ZigZag encoded) values
+    """
+    values = []
+    i = 0
+    while i < len(payload):
+        value = 0
+        for shift in range(0, 64, 7):
+            byte = payload[i]
+            i += 1
+            if shift == 56:
+                value |= byte << 56
+                break
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80 or i >= len(payload):
+                break
+        values.append(value)
+    return np.array(values, dtype=np.uint64)
+
+
+def decode_histogram(encoded, unit_ratio=1.0):
+    """
+    Decodes a histogram in the (compressed) V2 binary encoding of HdrHistogram
+    Args:
+        encoded: bytes of the encoded histogram, compressed or not
+        unit_ratio: Unit ratio of the returned histogram (see HdrHistogram)
+    Returns:
+        HdrHistogram with the decoded counts
+    """
+    cookie, length = struct.unpack_from('>ii', encoded)
+    if cookie & COOKIE_WORD_SIZE_MASK == V2_COMPRESSED_ENCODING_COOKIE:
+        encoded = zlib.decompress(encoded[8:8 + length])
+        cookie = struct.unpack_from('>i', encoded)[0]
+    if cookie & COOKIE_WORD_SIZE_MASK != V2_ENCODING_COOKIE:
+        raise ValueError(
+            f'Unsupported HdrHistogram encoding cookie {cookie:#x}, only the V2 encoding is supported')
+
+    (_, payload_length, normalizing_index_offset, significant_digits,
+     lowest_discernible_value, _, _) = struct.unpack_from('>iiiiqqd', encoded)
+    if normalizing_index_offset != 0:
+        raise ValueError('Shifted (normalized) HdrHistograms are not supported')
+
+    histogram = HdrHistogram(significant_digits, lowest_discernible_value, unit_ratio)
+    histogram.add_counts(decode_zigzag_leb128(
+        encoded[V2_HEADER_SIZE:V2_HEADER_SIZE + payload_length]))
+    return histogram
+
+
+def log_header_seconds(line, name):
+    """
+    Args:
+        line: Comment line of a .hlog file
+        name: Name of the header, e.g. 'StartTime'
+    Returns:
+        Seconds of a '#[<name>: <seconds> ...' header line, or None if the line is another comment
+    """
+    prefix = f'#[{name}: '
+    if not line.startswith(prefix):
+        return None
+    return float(line[len(prefix):].split()[0].rstrip(']'))
+
+
+def iter_hlog(filename, start=None, end=None, tag=None, unit_ratio=1.0):
+    """
+    Decodes the interval histograms of a HdrHistogram interval log (.hlog) one at a time.
+    Interval timestamps are resolved like the HistogramLogReader of HdrHistogram: relative to the BaseTime header
+    if there is one, otherwise relative to the StartTime header if they are more than a year before it, otherwise
+    absolute. The window is in seconds since the StartTime header, or since the first interval if the log has
+    absolute timestamps but no StartTime header.
+    Args:
+        filename: Name of the .hlog file
+        start: Optional start of the window in seconds since the start of the log
+        end: Optional end of the window in seconds since the start of the log (exclusive)
+        tag: Optional tag of the intervals to use, by default only untagged intervals are used
+        unit_ratio: Integer units per value, e.g. 1000000 for histograms of nanoseconds to get milliseconds
+    Returns:
+        Generator of a HdrHistogram per interval that starts within the window
+    """
+    start_time = None
+    base_time = None
+    with open_text(filename) as f:
+        for line in f:
+            if line.startswith('#'):
+                seconds = log_header_seconds(line, 'StartTime')
+                if seconds is not None:
+                    start_time = seconds
+                seconds = log_header_seconds(line, 'BaseTime')
+                if seconds is not None:
+                    base_time = seconds
+                continue
+            if line.startswith('"') or not line.strip():
+                continue
+            fields = line.rstrip('\r\n').split(',')
+            interval_tag = None
+            if fields[0].startswith('Tag='):
+                interval_tag = fields[0][len('Tag='):]
+                fields = fields[1:]
+            # Fields: start timestamp, interval length, interval max, base64 encoded histogram
+            timestamp = float(fields[0])
+            if base_time is None:
+                # Decided on the first interval, of any tag
+                relative = start_time is not None and timestamp < start_time - YEAR_SECONDS
+                base_time = start_time if relative else 0.0
+            if start_time is None:
+                start_time = timestamp + base_time if timestamp + base_time >= YEAR_SECONDS else 0.0
+            if interval_tag != tag:
+                continue
+            offset = timestamp + base_time - start_time
+            if (start is not None and offset < start) or (end is not None and offset >= end):
+                continue
+            yield decode_histogram(base64.b64decode(fields[3]), unit_ratio)
+
+
+def read_hlog(filename, start=None, end=None, tag=None, unit_ratio=1.0):
+    """
+    Reads a HdrHistogram interval log (.hlog) and merges the interval histograms within a time window
+    Args:
+        filename: Name of the .hlog file
+        start, end, tag, unit_ratio: See iter_hlog
+    Returns:
+        HdrHistogram with the merged counts of all intervals that start within the window
+    """
+    merged = None
+    for histogram in iter_hlog(filename, start, end, tag, unit_ratio):
+        if merged is None:
+            merged = histogram
+        else:
+            merged.merge(histogram)
+    if merged is None:
+        raise ValueError(f'No intervals in {filename} within the time window')
+    return merged
@@ -1,6 +1,18 @@
+import bisect
+import glob
+import itertools
 import os
-import re
 import sys
+import concurrent.futures
+
+import numpy as np
+
+from compression import open_text, strip_compression
+from hdr_histogram import HdrHistogram, iter_hlog
+
+
+# Distance to 1.0 of each amount of nines, 1/10^counter for counter 1 up to 19
+NINES_STEPS = tuple(1/(10 ** counter) for counter in range(1, 20))
 
 
 def get_9s(percentile):
@@ -11,14 +23,11 @@ def get_9s(percentile):
     Returns:
         The amount of 9s of the percentile, so 0.4->0, 0.92->1, 0.994->2, etc.
     """
-    counter = 1
-    # Limit to 20 nines, probably won't ever see higher amount than this due to exponential growth
-    while counter < 20:
-        if percentile + 1/(10 ** counter) < 1.0:
-            break
-        counter += 1
-
-    return counter - 1
+    # Limit to 19 nines, probably won't ever see higher amount than this due to exponential growth
+    for nines, step in enumerate(NINES_STEPS):
+        if percentile + step < 1.0:
+            return nines
+    return len(NINES_STEPS)
 
 
 def check_skip(previous, percentile, slack):
@@ -36,42 +45,186 @@ def check_skip(previous, percentile, slack):
     return percentile > previous + slack * (1 / (10 ** (prev_9s + 1)))
 
 
-def parse_hgrm(filename, lower=0.01, upper=0.99991):
+def is_data_row(line):
+    """
+    Method that checks if a line of a .hgrm file is a row of the percentile table
+    Args:
+        line: Line of the file
+    Returns:
+        True if the line starts with whitespace followed by a number
+    """
+    return line[:1] == ' ' and line.lstrip()[:1].isdigit()
+
+
+def thin_percentiles(percentiles, slack):
+    """
+    Method that selects the percentiles that are far enough apart, see check_skip
+    Args:
+        percentiles: numpy array of percentiles (range 0-1)
+        slack: Amount of distance between the percentiles (0-1)
+    Returns:
+        numpy array with the indices of the selected percentiles
+    """
+    selected = []
+    previous = 0.0
+    if np.all(percentiles[1:] >= percentiles[:-1]):
+        # Sorted, so the next selected percentile is the first one past the threshold of the previous one,
+        # this only visits the selected percentiles instead of every row
+        sorted_percentiles = percentiles.tolist()
+        while True:
+            threshold = previous + slack * (1 / (10 ** (get_9s(previous) + 1)))
+            position = bisect.bisect_right(sorted_percentiles, threshold)
+            if position >= len(sorted_percentiles):
+                break
+            selected.append(position)
+            previous = sorted_percentiles[position]
+    else:
+        for i, percentile in enumerate(percentiles):
+            if check_skip(previous, percentile, slack):
+                selected.append(i)
+                previous = percentile
+    return np.array(selected, dtype=np.intp)
+
+
+def parse_hgrm(filename, lower=0.01, upper=0.99991, slack=0.5):
     """
-    Method that parses a .hgrm file
+    Method that parses a .hgrm file, which may be compressed (see compression.py)
     Args:
         filename: Name of the file to parse
         lower: Lower percentile limit (range 0-1)
         upper: Upper percentile limit (range 0-1)
         slack: Minimum distance between 2 consecutive percentiles (range 0-1)
     Returns:
-        Tuple of 1. list of latencies, 2. list of corresponding percentiles
+        Tuple of 1. numpy array of latencies, 2. numpy array of corresponding percentiles
     """
-    latencies = []
-    percentiles = []
+    with open_text(filename) as f:
+        # Columns: 1. Latency, 2. Percentile (0-1), 3. Total count, 4. 1/(1-Percentile)
+        rows = [line for line in f.read().splitlines() if is_data_row(line)]
+    if not rows:
+        return np.array([]), np.array([])
+    table = np.loadtxt(rows, usecols=(0, 1), ndmin=2)
+    latencies = table[:, 0]
+    percentiles = table[:, 1]
 
-    # Groups:
-    # 1. Latency (format float xy.00000)
-    # 2. Percentile (format: float 0.90xyz)
-    # 3. Count (format: integer)
-    pattern = '^(?: )+([0-9]+\.[0-9]+)(?: )([0-1]\.[0-9]+) +([0-9]+)(?: )*'
+    in_bounds = (percentiles > lower) & (percentiles < upper)
+    latencies = latencies[in_bounds]
+    percentiles = percentiles[in_bounds]
+
+    selected = thin_percentiles(percentiles, slack)
+    return latencies[selected], percentiles[selected] * 100.0
 
-    # Previous percentile
-    previous = 0.0
 
-    for line in open(filename, 'r'):
-        line = line.rstrip('\r\n')  # remove newline
-        result = re.match(pattern, line)
-        if result:
-            # Got match
-            (latency, percentile, count) = result.group(1, 2, 3)
-            f_percentile = float(percentile)
-            if (f_percentile > lower and f_percentile < upper and check_skip(previous, f_percentile, 0.5)):
-                previous = f_percentile
-                latencies.append(float(latency))
-                percentiles.append(f_percentile * 100.0)
-
-    return latencies, percentiles
+def read_hgrm_histogram(filename, significant_digits=3, unit_ratio=1.0):
+    """
+    Method that reconstructs the bucket counts of a .hgrm file
+    The TotalCount column is cumulative, so the difference with the previous row is the amount of values
+    between the two row values. These are counted at the row value, which makes the reconstruction
+    exact at the rows of the table and an upper bound in between.
+    Args:
+        filename: Name of the .hgrm file
+        significant_digits: Significant digits of the histogram the file was written from
+        unit_ratio: Ratio the values in the file were divided by, e.g. 1000000 for nanoseconds written as milliseconds
+    Returns:
+        HdrHistogram with the reconstructed counts
+    """
+    with open_text(filename) as f:
+        rows = [line for line in f.read().splitlines() if is_data_row(line)]
+    histogram = HdrHistogram(significant_digits, unit_ratio=unit_ratio)
+    if rows:
+        table = np.loadtxt(rows, usecols=(0, 2), ndmin=2)
+        counts = np.diff(table[:, 1].astype(np.int64), prepend=0)
+        histogram.add_integers(np.rint(table[:, 0] * unit_ratio), counts)
+    return histogram
+
+
+def expand_sources(sources):
+    """
+    Method that expands the glob patterns in a list of histogram files
+    Args:
+        sources: List of file names and glob patterns
+    Returns:
+        List of file names, the matches of every pattern are sorted
+    """
+    filenames = []
+    for source in sources:
+        if glob.escape(source) == source:
+            filenames.append(source)
+            continue
+        matches = sorted(glob.glob(source))
+        if not matches:
+            raise FileNotFoundError(f'No histogram files match {source}')
+        filenames.extend(matches)
+    return filenames
+
+
+def iter_histograms(filename, options):
+    """
+    Method that reads the histograms of a .hgrm or .hlog file
+    Args:
+        filename: Name of the file
+        options: Dict with 'start', 'end' and 'tag' for .hlog files, 'significant_digits' for .hgrm files
+        and 'unit_ratio' for both
+    Returns:
+        Generator of HdrHistograms, one per interval of a .hlog file or one for a .hgrm file
+    """
+    unit_ratio = options.get('unit_ratio', 1.0)
+    if strip_compression(filename).endswith('.hlog'):
+        return iter_hlog(filename, options.get('start'), options.get('end'), options.get('tag'), unit_ratio)
+    return iter([read_hgrm_histogram(filename, options.get('significant_digits', 3), unit_ratio)])
+
+
+def merge_histogram_files(filenames, options):
+    """
+    Method that merges the histograms of files one at a time, so only two histograms are in memory
+    Args:
+        filenames: List of .hgrm and .hlog file names
+        options: Dict of options, see iter_histograms
+    Returns:
+        HdrHistogram with the merged counts, or None if there was nothing to merge
+    """
+    merged = None
+    for filename in filenames:
+        for histogram in iter_histograms(filename, options):
+            if merged is None:
+                merged = histogram
+            else:
+                merged.merge(histogram)
+    return merged
+
+
+def merge_histograms(sources, options=None, workers=1):
+    """
+    Method that merges the bucket counts of many histogram files into one histogram
+    Args:
+        sources: List of .hgrm and .hlog file names and glob patterns
+        options: Optional dict of options, see iter_histograms
+        workers: Amount of processes that decode files in parallel, each merges its own share of the files
+    Returns:
+        HdrHistogram with the merged counts of all files
+    """
+    options = options or {}
+    filenames = expand_sources(sources)
+    workers = min(workers, len(filenames))
+    if workers <= 1:
+        merged = merge_histogram_files(filenames, options)
+    else:
+        # A few shares per worker to even out files of different sizes
+        shares = min(len(filenames), workers * 4)
+        chunks = [filenames[i * len(filenames) // shares:(i + 1) * len(filenames) // shares]
+                  for i in range(shares)]
+        merged = None
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            # Results are merged as they arrive instead of being collected first
+            for histogram in executor.map(merge_histogram_files, chunks, itertools.repeat(options)):
+                if histogram is None:
+                    continue
+                if merged is None:
+                    merged = histogram
+                else:
+                    merged.merge(histogram)
+    if merged is None:
+        raise ValueError(f'No histograms in {sources} within the time window')
+    return merged
 
 
 def main(args):
@@ -0,0 +1,158 @@
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = '.prettypercentiles_cache'
+# Default size limit of the cache directory in bytes
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def file_identity(filename):
+    """
+    Args:
+        filename: Name of a source file
+    Returns:
+        List of absolute path, size and modification time, which changes whenever the file does
+    """
+    stat = os.stat(filename)
+    return [os.path.abspath(filename), stat.st_size, stat.st_mtime_ns]
+
+
+def function_identity(func):
+    """
+    Args:
+        func: Preprocessing or combination function, or None
+    Returns:
+        List of the name of the function, a hash of its code, the identity of the file that defines it
+        (see file_identity) and the values of its closure cells. Editing the file also invalidates the cache when
+        only a global the function uses or a helper it calls changes.
+    """
+    if func is None:
+        return None
+    # Decorated functions (e.g. profiler.timed) are identified by the function they wrap
+    func = inspect.unwrap(func)
+    name = f"{getattr(func, '__module__', None)}.{getattr(func, '__qualname__', repr(func))}"
+    code = getattr(func, '__code__', None)
+    if code is None:
+        return [name]
+    digest = hashlib.sha256(
+        code.co_code + repr(code.co_consts).encode()).hexdigest()
+    try:
+        source = inspect.getsourcefile(func)
+        module = None if source is None else file_identity(source)
+    except (TypeError, OSError):
+        # Defined interactively or in a file that no longer exists
+        module = None
+    closure = []
+    for cell in func.__closure__ or ():
+        try:
+            value = cell.cell_contents
+        except ValueError:
+            # Empty cell
+            value = None
+        closure.append(function_identity(value) if callable(value) else repr(value))
+    return [name, digest[:16], module, closure]
+
+
+class PercentileCache:
+    """
+    Directory with the computed percentiles of series, one .npz file per series.
+    Least recently used entries are removed when the directory grows beyond its size limit.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Args:
+            directory: Cache directory, created when the first entry is stored
+            max_bytes: Size limit of all entries together in bytes
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, description):
+        """
+        Args:
+            description: JSON serializable description of everything the percentiles depend on
+        Returns:
+            Cache key string
+        """
+        text = json.dumps(description, sort_keys=True, default=repr)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.npz')
+
+    def get(self, key):
+        """
+        Args:
+            key: Cache key (see key)
+        Returns:
+            Tuple of (percentiles, percentages, annotation or None, window starts or None),
+            or None if the key is not cached
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as entry:
+                annotation = str(entry['annotation']) if 'annotation' in entry else None
+                windows = entry['windows'] if 'windows' in entry else None
+                result = (entry['percentiles'], entry['percentages'], annotation, windows)
+        except (OSError, ValueError, KeyError):
+            return None
+        # Mark as recently used
+        os.utime(path)
+        return result
+
+    def put(self, key, percentiles, percentages, annotation=None, windows=None):
+        """
+        Stores the percentiles of a series and evicts the least recently used entries if the cache is too big
+        Args:
+            key: Cache key (see key)
+            percentiles: numpy array of percentiles
+            percentages: numpy array of percentages of the percentiles
+            annotation: Optional legend annotation of the series
+            windows: Optional numpy array with the start of every window of a windowed series
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        arrays = {'percentiles': np.asarray(percentiles),
+                  'percentages': np.asarray(percentages)}
+        if annotation is not None:
+            arrays['annotation'] = np.array(annotation)
+        if windows is not None:
+            arrays['windows'] = np.asarray(windows)
+        # Write to a temporary file first so concurrent processes never read a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(temp_path, self._path(key))
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache is within its size limit
+        """
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.npz'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        """
+        Removes the cache directory with all entries
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,253 @@
+import itertools
+import os
+import time
+
+import matplotlib.pyplot as plt
+import numpy as np
+import seaborn as sns
+from profiler import span
+
+# Default resolution of png output
+DEFAULT_DPI = 600
+
+
+def output_filenames(filename, formats):
+    """
+    Arguments:
+        filename: The destination file name of the output image
+        formats: List of output formats (png, svg, pdf, etc.), None for the format of the file name extension
+    Returns: Dict where key = format, value = file name, the extension of the file name is replaced by the format
+    """
+    (root, extension) = os.path.splitext(filename)
+    if not formats:
+        formats = [extension[1:] or 'png']
+    return {image_format: filename if extension[1:] == image_format else f'{root}.{image_format}'
+            for image_format in formats}
+
+
+def save_figure(fig, lg, filename, output=None, started=None):
+    """
+    Saves a figure in every output format, through temporary files so a viewer (e.g. in --follow mode)
+    never shows a partial image. The figure is laid out once, every format uses the same bounding box.
+    Arguments:
+        fig: The matplotlib figure
+        lg: The legend of the figure, which is outside of the axes
+        filename: The destination file name of the output image
+        output: Optional dict of output settings (see output_settings)
+        started: Optional time.perf_counter() when building the figure started, for the timing breakdown
+    """
+    if output is None:
+        output = {}
+    dpi = output.get('dpi') or DEFAULT_DPI
+    timings = []
+    if started is not None:
+        timings.append(('build', time.perf_counter() - started))
+    try:
+        # Tight bounding box including the legend, with the text measured at the output dpi like savefig does
+        start = time.perf_counter()
+        with span('layout', filename):
+            original_dpi = fig.dpi
+            fig.set_dpi(dpi)
+            bbox = fig.get_tightbbox(fig.canvas.get_renderer(), bbox_extra_artists=(lg,)).padded(
+                plt.rcParams['savefig.pad_inches'])
+            fig.set_dpi(original_dpi)
+        timings.append(('layout', time.perf_counter() - start))
+
+        for image_format, image_filename in output_filenames(filename, output.get('formats')).items():
+            start = time.perf_counter()
+            temp_filename = f'{image_filename}.tmp'
+            try:
+                with span('save', image_filename) as record:
+                    fig.savefig(temp_filename, dpi=dpi, bbox_inches=bbox, format=image_format)
+                    os.replace(temp_filename, image_filename)
+                    record['bytes'] = os.path.getsize(image_filename)
+            except BaseException:
+                if os.path.exists(temp_filename):
+                    os.remove(temp_filename)
+                raise
+            timings.append((image_format, time.perf_counter() - start))
+    finally:
+        plt.close(fig)
+    if output.get('timing'):
+        print(f'Render {filename}: ' + ', '.join(f'{stage} {seconds:.3f}s' for stage, seconds in timings)
+              + f', total {sum(seconds for _, seconds in timings):.3f}s')
+
+
+# Tuple of (font_scale, dark_mode) of the style that is currently set
+current_plot_style = None
+
+
+def set_plot_style(font_scale, dark_mode):
+    """
+    Resets seaborn and sets the style shared by all plots
+    Arguments:
+        font_scale: Scale of font, 1 is normal
+        dark_mode: Whether to use dark mode
+    """
+    global current_plot_style
+    # Consecutive plots with the same style (e.g. in batch mode) keep the style that is already set
+    if current_plot_style == (font_scale, dark_mode):
+        return
+    current_plot_style = (font_scale, dark_mode)
+
+    # Reset sns before every plot
+    sns.reset_defaults()
+
+    clear_bkgd = {
+        'axes.facecolor': 'none',
+        'figure.facecolor': 'none'
+    }
+
+    # Dark mode
+    if dark_mode:
+        dark_text_color = 'white'
+
+        clear_bkgd['text.color'] = dark_text_color
+        clear_bkgd['axes.labelcolor'] = dark_text_color
+        clear_bkgd['xtick.color'] = dark_text_color
+        clear_bkgd['ytick.color'] = dark_text_color
+
+        sns.set(style='darkgrid', font_scale=font_scale,
+                palette="muted", rc=clear_bkgd)
+    else:
+        clear_bkgd = {'axes.facecolor': 'none', 'figure.facecolor': 'none'}
+        sns.set(style='ticks', font_scale=font_scale,
+                palette="muted", rc=clear_bkgd)
+
+
+def plot_percentiles_multiple(title, percentiles_map, percentages_map, filename, num_intervals, y_log, line_formats, x_axis_label, y_axis_label, font_scale, dark_mode, annotations=None, output=None):
+    """
+    Plot function for the given percentiles
+    Adapted from https://stackoverflow.com/questions/42072734/percentile-distribution-graph
+    Arguments:
+        title: Title of the plot
+        percentiles_map: Dict where key is label and value are percentiles
+        percentages_map: Dict where key is label and value list of percentages used
+        filename: The destination file name of the output image
+        num_intervals: The number of intervals to display
+        y_log: True will display y axis on log scale, False will use linear scale
+        line_formats: Dict where key is label and value is tuple of (marker, linestyle, color) for plot
+        x_axis_label: Label below x axis
+        y_axis_label: Label to the left of y axis
+        font_scale: Scale of font, 1 is normal
+        dark_mode: Whether to use dark mode
+        annotations: Optional dict where key is label and value is text displayed after the label in the legend
+        output: Optional dict of output settings (see output_settings)
+    """
+    started = time.perf_counter()
+    set_plot_style(font_scale, dark_mode)
+
+    # Increase by one to get last xtick included as well
+    num_intervals += 1
+
+    # Number of intervals to display.
+    # Later calculations add 2 to this number to pad it to align with the reversed axis
+    x_values = 1.0 - 1.0 / 10 ** np.arange(0, num_intervals + 2)
+
+    # Start with hard-coded lengths for 0,90,99
+    # Rest of array generated to display correct number of decimal places as precision increases
+    lengths = [1, 2, 2] + \
+        [int(v) + 1 for v in list(np.arange(3, num_intervals + 2))]
+
+    # Build the label string by trimming on the calculated lengths and appending %
+    labels = [str(100 * v)[0:l] + "%" for v, l in zip(x_values, lengths)]
+
+    fig, ax = plt.subplots()
+    # sns.set(rc={'figure.figsize': (10, 5)})
+    # Set x axis to log scale
+    ax.set_xscale('log')
+    # Invert x axis
+    plt.gca().invert_xaxis()
+    # Labels have to be reversed because axis is reversed
+    ax.xaxis.set_ticklabels(labels[::-1])
+
+    # Cyclic iteraters for markers and linestyles
+    markers = itertools.cycle(['.', ',', 'o', 'v', '^', '<', '>', '1', '2',
+                               '3', '4', 's', 'p', '*', 'h', 'H', '+', 'x', 'D', 'd', '|', '_'])
+    linestyles = itertools.cycle(['-', '--', '-.', ':'])
+
+    if annotations is None:
+        annotations = {}
+
+    # Plot distribution with different markers and lines each time
+    for key in percentiles_map:
+        label = f'{key} ({annotations[key]})' if key in annotations else key
+        if key in line_formats:
+            marker = line_formats[key][0]
+            linestyle = line_formats[key][1]
+            color = line_formats[key][2]
+            ax.plot(100.0 - np.asarray(percentages_map[key]), percentiles_map[key], marker=marker,
+                    linestyle=linestyle, color=color, label=label, alpha=0.7)
+        else:
+            ax.plot(100.0 - np.asarray(percentages_map[key]), percentiles_map[key], marker=next(markers),
+                    linestyle=next(linestyles), label=label, alpha=0.7)
+
+    # Grid lines
+    # Major lines (every 90%, 99%, 99.9%, etc.)
+    ax.grid(True, linewidth=0.5, zorder=5)
+    # Minor lines (10%, 20%,..., 80%, 91%, 92%,...,98%, etc.)
+    ax.grid(True, which='minor', linewidth=0.5,
+            linestyle=':')
+
+    # Make y axis log scale
+    if (y_log):
+        ax.set_yscale('log')
+
+    # Set y axis label
+    ax.set_ylabel(y_axis_label)
+    # Set x axis label
+    ax.set_xlabel(x_axis_label)
+    # Set title
+    ax.set_title(title)
+
+    # Put a legend to the right of the plot
+    lg = ax.legend(loc='center left', bbox_to_anchor=(
+        1.0, 0.5))
+
+    sns.despine(fig=fig)
+
+    save_figure(fig, lg, filename, output, started)
+
+
+def plot_percentiles_over_time(title, over_time, indices, filename, y_log, y_axis_label, font_scale, dark_mode, output=None):
+    """
+    Plots the percentiles of windowed series over time, a line per series and percentile
+    Arguments:
+        title: Title of the plot
+        over_time: Dict where key is label and value is tuple of (window starts, percentages, percentiles per window)
+        indices: Indices of the percentages to draw a line for
+        filename: The destination file name of the output image
+        y_log: True will display y axis on log scale, False will use linear scale
+        y_axis_label: Label to the left of y axis
+        font_scale: Scale of font, 1 is normal
+        dark_mode: Whether to use dark mode
+        output: Optional dict of output settings (see output_settings)
+    """
+    started = time.perf_counter()
+    set_plot_style(font_scale, dark_mode)
+
+    fig, ax = plt.subplots()
+    linestyles = itertools.cycle(['-', '--', '-.', ':'])
+    for key, (starts, percentages, percentiles) in over_time.items():
+        linestyle = next(linestyles)
+        for index in indices:
+            if index >= len(percentages):
+                continue
+            ax.plot(starts, percentiles[:, index], marker='.', linestyle=linestyle,
+                    label=f'{key} {percentages[index]:g}%', alpha=0.7)
+
+    ax.grid(True, linewidth=0.5, zorder=5)
+    if (y_log):
+        ax.set_yscale('log')
+    ax.set_ylabel(y_axis_label)
+    ax.set_xlabel('Time since the first window')
+    ax.set_title(title)
+
+    # Put a legend to the right of the plot
+    lg = ax.legend(loc='center left', bbox_to_anchor=(
+        1.0, 0.5))
+
+    sns.despine(fig=fig)
+
+    save_figure(fig, lg, filename, output, started)
+
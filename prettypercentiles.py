@@ -1,16 +1,116 @@
 import argparse
-import csv
-import matplotlib.pyplot as plt
-import matplotlib.ticker as mticker
+import collections
 import numpy as np
-import seaborn as sns
 import itertools
+import glob
 import importlib
+import os
+import pickle
 import sys
-from hdr_parser import parse_hgrm
+import time
+import concurrent.futures
+from hdr_parser import expand_sources, merge_histograms, parse_hgrm
+from csv_loader import (load_columns_from_file, convert_csv, follow_csv, read_csv_header, consumer_columns,
+                        check_dtype, DtypeError)
+from compression import strip_compression
+from quantile_sketch import QuantileSketch
+from hdr_histogram import HdrHistogram, WindowedHistograms
+from percentile_cache import PercentileCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, file_identity, function_identity
+from export import export_series
+from profiler import Profiler, span
+from shared_columns import SharedColumns, attach, detach
+from customfunctions import reduce_columns
 from customfunctions import *
 
 
+def common_parser():
+    """
+    Returns: Parser without help of the options that the plot cli and the batch subcommand share,
+    pass it to their parsers as parent
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument(
+        "--parse-jobs",
+        type=int,
+        default=1,
+        help="Amount of processes that parse parts of a single csv file in parallel",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Don't read or store computed percentiles in the cache",
+    )
+    parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="Remove all cached percentiles before running",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=DEFAULT_CACHE_DIR,
+        help="Directory of the percentile cache",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_MAX_BYTES // (1024 * 1024),
+        help="Size limit of the percentile cache in MB, least recently used entries are removed first",
+    )
+    parser.add_argument(
+        "--formats",
+        type=str,
+        nargs="+",
+        help="Output formats (png, svg, pdf, etc.) written from the same figure, overrides output_formats of the config",
+    )
+    parser.add_argument(
+        "--dpi",
+        type=int,
+        help="Resolution of png output, overrides dpi of the config (default 600)",
+    )
+    parser.add_argument(
+        "--preview",
+        action="store_true",
+        help="Fast low resolution png output (%d dpi), for a quick look" % PREVIEW_DPI,
+    )
+    parser.add_argument(
+        "--max-points",
+        type=int,
+        help="Maximum amount of points per line, overrides max_points of the config (default %d)" % DEFAULT_MAX_POINTS,
+    )
+    parser.add_argument(
+        "--timing",
+        action="store_true",
+        help="Print how long building, laying out and saving every figure takes",
+    )
+    parser.add_argument(
+        "--no-plot",
+        action="store_true",
+        help="Don't render any image, e.g. together with --export",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print the wall time, rows, bytes, throughput and peak memory of every stage and series",
+    )
+    parser.add_argument(
+        "--profile-json",
+        type=str,
+        help="Write the profile spans and summary to this .json file (implies --profile)",
+    )
+    parser.add_argument(
+        "--profile-trace",
+        type=str,
+        help="Write the profile as a Chrome trace to this file, for chrome://tracing or Perfetto (implies --profile)",
+    )
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="Trace the peak memory allocated during every stage instead of the peak process memory, slows the run down",
+    )
+    return parser
+
+
 def parse_args(args):
     """
     Parses the arguments of the benchmark plot cli
@@ -18,7 +118,7 @@ def parse_args(args):
         args: Program arguments, excluding first argument (filename being executed)
     Returns: The parsed arguments
     """
-    parser = argparse.ArgumentParser(description="prettypercentiles")
+    parser = argparse.ArgumentParser(description="prettypercentiles", parents=[common_parser()])
     parser.add_argument(
         "-c",
         "--config",
@@ -26,77 +126,1296 @@ def parse_args(args):
         default="configs.plot_config",
         help="The config file location",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Amount of processes to load and reduce independent series in parallel",
+    )
+    parser.add_argument(
+        "--export",
+        type=str,
+        nargs="+",
+        default=[],
+        help="Files to write the computed percentiles to, the format is picked by extension (.json, .csv, .parquet)",
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="Keep following the csv files while they grow and re-render the plot every interval",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=5.0,
+        help="Seconds between refreshes in --follow mode",
+    )
+    return parser.parse_args(args)
+
+
+def parse_convert_args(args):
+    """
+    Parses the arguments of the convert subcommand
+    Arguments:
+        args: Program arguments after 'convert'
+    Returns: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        prog="prettypercentiles convert",
+        description="Converts csv columns to .npy files, which are memory mapped instead of parsed when plotting")
+    parser.add_argument(
+        "csv_files",
+        type=str,
+        nargs="+",
+        help="The csv files to convert",
+    )
+    parser.add_argument(
+        "-C",
+        "--columns",
+        type=str,
+        nargs="+",
+        help="The columns to convert, defaults to all columns",
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        type=str,
+        help="Directory to write the .npy files to, defaults to the directory of each csv file",
+    )
+    parser.add_argument(
+        "--dtype",
+        type=str,
+        default="float64",
+        help="Type of the .npy files, e.g. uint32 or int64 for integer latencies, float32 to halve the size",
+    )
     return parser.parse_args(args)
 
 
+def convert(args):
+    """
+    Convert subcommand, writes one .npy file per column next to the csv file
+    Arguments:
+        args: Program arguments after 'convert'
+    """
+    params = parse_convert_args(args)
+    for csv_file in params.csv_files:
+        for column, npy_file in convert_csv(csv_file, params.columns, params.output_dir, dtype=params.dtype).items():
+            print(f'{csv_file} {column} -> {npy_file}')
+
+
+def parse_batch_args(args):
+    """
+    Parses the arguments of the batch subcommand
+    Arguments:
+        args: Program arguments after 'batch'
+    Returns: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        prog="prettypercentiles batch",
+        description="Plots many configs in one process, csv files used by several configs are read once",
+        parents=[common_parser()])
+    parser.add_argument(
+        "configs",
+        type=str,
+        nargs="+",
+        help="Config module names (configs.example_config) or config file names and globs (configs/nightly_*.py)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Amount of processes that render the plots",
+    )
+    parser.add_argument(
+        "--export",
+        type=str,
+        nargs="+",
+        default=[],
+        help="Files to write the computed percentiles to, the format is picked by extension (.json, .csv, .parquet), {config} is replaced by the config module name",
+    )
+    return parser.parse_args(args)
+
+
+def start_profiler(params):
+    """
+    Starts recording a profile if --profile, --profile-json, --profile-trace or --profile-memory is given
+    Arguments:
+        params: The parsed arguments
+    Returns: The started Profiler, or None if not profiling
+    """
+    if not (params.profile or params.profile_json or params.profile_trace or params.profile_memory):
+        return None
+    profiler = Profiler(trace_memory=params.profile_memory)
+    profiler.start()
+    return profiler
+
+
+def report_profile(profiler, params):
+    """
+    Stops a profile, prints its summary table and writes the requested profile files
+    Arguments:
+        profiler: Profiler returned by start_profiler, nothing is done if None
+        params: The parsed arguments
+    """
+    if profiler is None:
+        return
+    profiler.stop()
+    print(profiler.format_summary())
+    if params.profile_json:
+        profiler.write_json(params.profile_json)
+        print(f'Profile written to {params.profile_json}')
+    if params.profile_trace:
+        profiler.write_chrome_trace(params.profile_trace)
+        print(f'Profile trace written to {params.profile_trace}')
+
+
+def output_settings(config, params=None):
+    """
+    Gets the output settings of the plots of a config
+    Arguments:
+        config: The imported config module, with optional output_formats, dpi and max_points
+        params: Optional parsed arguments, whose --formats, --dpi, --preview, --max-points and --timing
+        override the config
+    Returns: Dict with 'formats' (list of formats or None for the extension of the file name), 'dpi' (None for the default),
+    'max_points' (maximum amount of points per line, see thin_points) and 'timing'
+    """
+    formats = getattr(config, 'output_formats', None)
+    dpi = getattr(config, 'dpi', None)
+    max_points = getattr(config, 'max_points', DEFAULT_MAX_POINTS)
+    timing = False
+    if params is not None:
+        if params.formats:
+            formats = params.formats
+        if params.dpi:
+            dpi = params.dpi
+        if params.preview:
+            formats = ['png']
+            dpi = PREVIEW_DPI
+        if params.max_points:
+            max_points = params.max_points
+        timing = params.timing
+    return {'formats': formats, 'dpi': dpi, 'max_points': max_points, 'timing': timing}
+
+
+def config_module_names(patterns):
+    """
+    Arguments:
+        patterns: List of config module names, config file names and glob patterns of config files
+    Returns: List of unique config module names in the given order, the matches of every glob are sorted
+    """
+    names = []
+    for pattern in patterns:
+        if pattern.endswith('.py') or glob.escape(pattern) != pattern:
+            filenames = sorted(glob.glob(pattern))
+            if not filenames:
+                raise FileNotFoundError(f'No config files match {pattern}')
+            matches = [os.path.splitext(os.path.normpath(filename))[0].replace(os.sep, '.')
+                       for filename in filenames]
+        else:
+            matches = [pattern]
+        names.extend(name for name in matches if name not in names)
+    return names
+
+
+def batch(args):
+    """
+    Batch subcommand, plots many configs in one process
+    Arguments:
+        args: Program arguments after 'batch'
+    """
+    params = parse_batch_args(args)
+    profiler = start_profiler(params)
+    try:
+        run_batch(params)
+    finally:
+        report_profile(profiler, params)
+
+
+def run_batch(params):
+    """
+    Computes, exports and renders the configs of the batch subcommand
+    Arguments:
+        params: The parsed arguments of the batch subcommand
+    """
+    configs = {}
+    for name in config_module_names(params.configs):
+        try:
+            configs[name] = importlib.import_module(name)
+        except Exception as e:
+            report_failure(name, e)
+    config_names = list(configs)
+
+    cache = PercentileCache(params.cache_dir, params.cache_size * 1024 * 1024)
+    if params.clear_cache:
+        cache.clear()
+    if params.no_cache:
+        cache = None
+
+    if len(config_names) > 1 and any('{config}' not in template for template in params.export):
+        raise ValueError(
+            'Export file names need {config} when exporting several configs')
+
+    results = compute_batch(configs, params.parse_jobs, cache)
+    # Configs that failed are reported and left out
+    config_names = [name for name in config_names if name in results]
+
+    for name in config_names:
+        (_, perc_map, percentage_map, annotations, window_map) = results[name]
+        for template in params.export:
+            export_filename = template.replace('{config}', name)
+            with span('export', export_filename) as record:
+                export_series(export_filename, perc_map,
+                              percentage_map, annotations, window_map)
+                record['bytes'] = os.path.getsize(export_filename)
+            print(f'Exported {export_filename}')
+    if params.no_plot:
+        return
+
+    if params.jobs > 1:
+        # Workers stay alive for all plots, so imports and the plot style are set up once per worker
+        with concurrent.futures.ProcessPoolExecutor(max_workers=params.jobs) as pool:
+            futures = {name: pool.submit(render_config, name, *results[name],
+                                         output_settings(configs[name], params))
+                       for name in config_names}
+            for name, future in futures.items():
+                try:
+                    # Only the wait is recorded, the render spans are in the worker processes
+                    with span('render', name):
+                        future.result()
+                    print(f'Rendered {name}: {configs[name].file_name}')
+                except Exception as e:
+                    report_failure(name, e)
+    else:
+        for name in config_names:
+            try:
+                render_config(name, *results[name],
+                              output_settings(configs[name], params))
+                print(f'Rendered {name}: {configs[name].file_name}')
+            except Exception as e:
+                report_failure(name, e)
+
+
+def compute_batch(configs, parse_jobs=1, cache=None):
+    """
+    Computes the series of many configs, configs that read the same csv files load them together
+    so every (file, column) is parsed and preprocessed once. Groups of configs that share no files are
+    loaded one after the other, so only the columns of one group are in memory at a time.
+    Arguments:
+        configs: Dict where key = config module name, value = the imported config module
+        parse_jobs: Amount of processes that parse parts of each csv file in parallel
+        cache: Optional PercentileCache
+    Returns: Dict where key = config module name, value = tuple of (np_sample_points, then the same as compute_series),
+    configs that fail (e.g. a malformed config) are reported and left out, without affecting the others
+    """
+    plans = {}
+    for name, config in configs.items():
+        try:
+            plans[name] = SeriesPlan(config, get_sample_points(config.num_intervals), cache=cache)
+        except Exception as e:
+            report_failure(name, e)
+    results = {}
+    for group in group_by_files({name: series.files() for name, series in plans.items()}):
+        plan = {}
+        consumers = {}
+        # The configs of the group share the loaded and preprocessed columns
+        uses = collections.Counter()
+        for name in group:
+            uses.update(plans[name].uses)
+            for csv_file, columns in plans[name].plan.items():
+                planned = plan.setdefault(csv_file, {})
+                for column, dtype in columns.items():
+                    planned[column] = merge_dtypes(planned[column], dtype) if column in planned else dtype
+            for csv_file, file_consumers in plans[name].consumers.items():
+                consumers.setdefault(csv_file, []).extend(file_consumers)
+        errors = {}
+        columns = load_columns(plan, consumers, parse_jobs, errors)
+        for name in group:
+            try:
+                results[name] = (plans[name].np_sample_points,) + \
+                    plans[name].finish(columns, parse_jobs, uses=uses, errors=errors)
+            except Exception as e:
+                report_failure(name, e)
+        del columns
+    return results
+
+
+def render_config(config_name, np_sample_points, perc_map, percentage_map, annotations, window_map, output=None):
+    """
+    Renders the computed series of a config, also in a worker process
+    Arguments:
+        config_name: Module name of the config
+        np_sample_points, perc_map, percentage_map, annotations, window_map, output: See render
+    """
+    config = importlib.import_module(config_name)
+    render(config, np_sample_points, perc_map,
+           percentage_map, annotations, window_map, output)
+
+
+# Resolution of png output in --preview mode
+PREVIEW_DPI = 100
+
+# Default maximum amount of points per line in the percentile plot
+DEFAULT_MAX_POINTS = 500
+
+# Relative accuracy of the sketch that --follow records columns without 'sketch', 'hdr' or 'window' option into
+FOLLOW_SKETCH_ACCURACY = 0.01
+
+# Sample points of every interval, the first interval is 15%-90%, the next one 91.5%-99% etc.
+INTERVAL_SAMPLE_POINTS = [15.0, 30.0, 50.0, 60.0, 70.0, 80.0, 90.0]
+
+# Bump when the computation of cached percentiles changes, so old cache entries are not used anymore
+CACHE_VERSION = 3
+
+# Builtin combination functions that map onto a single numpy reduction over the columns
+UFUNC_REDUCTIONS = {sum: np.add, max: np.maximum, min: np.minimum}
+
+
 def combine(func, *arrays):
     """
     Combines n arrays by adding the elements at the same index together in the new array
     Arguments:
-        func: function that takes in the n elements at each index and combines them
-        *arrays: N arrays to combine
-    Returns: A new array where all elements are the combination of the elements at the same index in the source arrays using func
+        func: function that combines the columns, either a builtin sum/max/min, a function marked
+        with @vectorized that takes the list of column arrays, or a function that takes in the n elements at each index
+        *arrays: N arrays to combine, longer arrays are cut to the length of the shortest one
+    Returns: A new numpy array where all elements are the combination of the elements at the same index in the source arrays using func
+    """
+    # Like zip, rows past the end of the shortest column are left out
+    length = min(len(array) for array in arrays)
+    arrays = [np.asarray(array)[:length] for array in arrays]
+    if func is sum:
+        # Sums of compact integer columns (e.g. uint32) are done in 64 bits so they don't overflow
+        dtype = np.result_type(*arrays)
+        if dtype.kind in 'iu':
+            dtype = np.dtype(np.uint64 if dtype.kind == 'u' else np.int64)
+        return reduce_columns(np.add, arrays, dtype)
+    if func in UFUNC_REDUCTIONS:
+        return reduce_columns(UFUNC_REDUCTIONS[func], arrays)
+    if getattr(func, 'vectorized', False):
+        return np.asarray(func(arrays))
+    # Compatibility path for scalar combination functions
+    return np.fromiter((func(elements) for elements in zip(*arrays)), dtype=np.float64)
+
+
+def partition_ranks(values, ranks):
+    """
+    Partitions values in place so every index in ranks holds the value it would have when sorted
+    Recursively partitions at the rank closest to the middle of the current segment,
+    so the tail ranks (which are close together) end up in small segments quickly.
+    Arguments:
+        values: numpy array to partition in place
+        ranks: sorted numpy array of unique indices into values
     """
-    return [func(elements) for elements in zip(*arrays)]
+    n = len(values)
+    if len(ranks) == 0:
+        return
+    if len(ranks) == 1:
+        values.partition(ranks[0])
+        return
+    # Small or densely ranked segments are cheaper to sort outright
+    if n <= 4096 or len(ranks) * 32 > n:
+        values.sort()
+        return
+    middle = int(np.argmin(np.abs(ranks - n // 2)))
+    pivot = ranks[middle]
+    values.partition(pivot)
+    partition_ranks(values[:pivot], ranks[:middle])
+    partition_ranks(values[pivot + 1:], ranks[middle + 1:] - pivot - 1)
 
 
-def get_percentiles(latency_list, percentages):
+def get_percentiles(latency_list, percentages, overwrite_input=False):
     """
     Get the percentiles of the given latency list
+    Instead of sorting, the ranks of all percentages are selected with one set of partitions,
+    interpolation matches np.percentile (linear method).
     Arguments:
-        latency_list: The list with latencies as elements
-        p: List of percentiles to plot
+        latency_list: The list or numpy array with latencies as elements
+        percentages: List of percentages (0-100) to get the percentiles for
+        overwrite_input: If True and latency_list is a numpy array it is partitioned in place,
+        which avoids copying it but reorders its elements
     Returns: numpy array of the percentiles at the given percentages
     """
-    latency_np = np.array(latency_list)  # Convert to numpy array
-    sorted_np = np.sort(latency_np)  # Sort latencies
+    latency_np = np.asarray(latency_list)
+    n = latency_np.size
+    if n == 0:
+        raise ValueError('Cannot get percentiles of an empty latency list')
+    if not (overwrite_input and latency_np is latency_list and latency_np.ndim == 1):
+        latency_np = latency_np.flatten()
 
-    perc = np.percentile(sorted_np, percentages)
-    return perc
+    # Fractional ranks of the percentages in the sorted data
+    ranks = np.asarray(percentages, dtype=np.float64) / 100.0 * (n - 1)
+    lower = np.floor(ranks).astype(np.intp)
+    weights = ranks - lower
+
+    selected = np.unique(lower)
+    partition_ranks(latency_np, selected)
+
+    # After partitioning, the next order statistic is the minimum of the segment up to the next selected rank
+    ends = np.append(selected[1:], n - 1)
+    next_values = np.array([latency_np[rank + 1:end + 1].min() if rank + 1 < n else latency_np[rank]
+                            for rank, end in zip(selected, ends)])
+
+    below = latency_np[lower].astype(np.float64)
+    above = next_values[np.searchsorted(selected, lower)].astype(np.float64)
+    diff = above - below
+    # Same interpolation as numpy, which is exact at both ends
+    return np.where(weights >= 0.5, above - diff * (1 - weights), below + diff * weights)
 
 
 def get_from_csv(csv_file, column):
     """
     Get column from csv file.
+    The file is streamed in bounded chunks straight into a numpy buffer, only the requested column is parsed.
     Arguments:
         csv_file: name of the csv file
         column: column to extract
-    Returns: column as a List of floats
-    """
-    result = []
-    # Source: https://stackoverflow.com/a/16503661
-    with open(csv_file) as f:
-        reader = csv.DictReader(f)  # read rows into a dictionary format
-        # read a row as {column1: value1, column2: value2,...}
-        for row in reader:
-            result.append(float(row[column]))
-    return result
+    Returns: column as a numpy array of floats
+    """
+    return load_columns_from_file(csv_file, [column])[column]
+
+
+def parse_column_spec(value):
+    """
+    Splits a column tuple into its parts
+    Arguments:
+        value: tuple of (csv filename, column, optional preprocessing function, optional dict of options)
+    Returns: tuple of (csv filename, column, preprocessing function or None, dict of options)
+    """
+    func = None
+    options = {}
+    for extra in value[2:]:
+        if isinstance(extra, dict):
+            options = extra
+        else:
+            func = extra
+    return value[0], value[1], func, options
+
+
+def is_streamed(value):
+    """
+    Checks whether a column tuple is reduced while streaming instead of being kept in memory
+    Arguments:
+        value: column tuple (see parse_column_spec)
+    Returns: True if the column only needs to be streamed
+    """
+    options = parse_column_spec(value)[3]
+    return 'sketch' in options or 'hdr' in options or 'window' in options
+
+
+def plan_columns(label_map, combined_columns):
+    """
+    Collects every (csv filename, column) pair referenced by the config so each file only has to be read once
+    Streamed columns (see is_streamed) in the label_map are not kept in memory, so they are left out.
+    Arguments:
+        label_map: Dict where key = label, value = tuple of (csv filename, column, optional preprocessing function)
+        combined_columns: Dict where key = label, value = tuple of (combination function, list of tuples)
+    Returns: Dict where key = csv filename, value = dict where key = column to load from it,
+    value = numpy dtype to load it as, which holds the 'dtype' options of all series that read it (see merge_dtypes)
+    """
+    values = [value for value in label_map.values() if not is_streamed(value)]
+    for pair in combined_columns.values():
+        values.extend(pair[1])
+
+    plan = {}
+    for value in values:
+        csv_file, column, _, options = parse_column_spec(value)
+        columns = plan.setdefault(csv_file, {})
+        declared = options.get('dtype')
+        columns[column] = merge_dtypes(columns[column], declared) if column in columns else \
+            np.dtype(declared or np.float64)
+    return plan
+
+
+def column_uses(label_map, combined_columns):
+    """
+    Counts how often every column is read, so handle_preprocessing can drop a column after its last use
+    Arguments:
+        label_map, combined_columns: See plan_columns
+    Returns: Counter where key = key of a preprocessed or converted column (see column_keys),
+    value = amount of series that use it, or (csv filename, column) for a loaded column, value = amount of series
+    that use it as it is plus the amount of preprocessed or converted columns that are made from it once
+    """
+    values = [value for value in label_map.values() if not is_streamed(value)]
+    for pair in combined_columns.values():
+        values.extend(pair[1])
+
+    uses = collections.Counter()
+    for value in values:
+        (raw_key, key) = column_keys(value)
+        if key == raw_key or key not in uses:
+            uses[raw_key] += 1
+        if key != raw_key:
+            uses[key] += 1
+    return uses
+
+
+def column_keys(value):
+    """
+    Arguments:
+        value: tuple of (csv filename, column, preprocessing function, optional dict of options)
+    Returns: Tuple of 1. key of the loaded column, (csv filename, column), 2. key of the column as the series reads it,
+    (csv filename, column, preprocessing function or None, declared dtype or None),
+    or the key of the loaded column if the series reads it as it is
+    """
+    csv_file, column, func, options = parse_column_spec(value)
+    raw_key = (csv_file, column)
+    dtype = options.get('dtype')
+    if func is None and dtype is None:
+        return raw_key, raw_key
+    return raw_key, (csv_file, column, func, None if dtype is None else np.dtype(dtype))
+
+
+def merge_dtypes(first, second):
+    """
+    A column is loaded once for all series that use it, so it gets a dtype that can hold the dtypes they declare.
+    Every series then gets the column in its own dtype (see handle_preprocessing).
+    Arguments:
+        first, second: numpy dtypes (or names) declared for the same column, None if not declared (float64)
+    Returns: The promoted numpy dtype
+    """
+    return np.promote_types(np.float64 if first is None else first, np.float64 if second is None else second)
+
+
+def make_sink(options):
+    """
+    Creates the object a streamed column is reduced into
+    Arguments:
+        options: Dict of options of the column tuple (see parse_column_spec)
+    Returns: QuantileSketch for the 'sketch' option, WindowedHistograms for the 'window' option,
+    HdrHistogram for the 'hdr' option
+    """
+    if 'sketch' in options:
+        return QuantileSketch(options['sketch'])
+    if 'window' in options:
+        return WindowedHistograms(options['window'], options.get('hdr', 3), options.get('unit_ratio', 1.0))
+    return HdrHistogram(options['hdr'], unit_ratio=options.get('unit_ratio', 1.0))
+
+
+def plan_streams(label_map):
+    """
+    Creates the sketches and histograms of all streamed columns in the label_map
+    Arguments:
+        label_map: Dict where key = label, value = tuple of (csv filename, column, optional preprocessing function, optional dict of options)
+    Returns: Tuple of 1. dict where key = label, value = sketch or histogram the column is streamed into,
+    2. dict where key = csv filename, value = list of tuples of (column, sink, preprocessing function) (see load_columns)
+    """
+    sinks = {}
+    consumers = {}
+    for label, value in label_map.items():
+        if not is_streamed(value):
+            continue
+        csv_file, column, func, options = parse_column_spec(value)
+        sinks[label] = make_sink(options)
+        if 'window' in options:
+            # Windowed histograms get the timestamp of every value as well
+            column = (column, options['timestamp'])
+        consumers.setdefault(csv_file, []).append(
+            (column, sinks[label], func))
+    return sinks, consumers
 
 
-def handle_preprocessing(value):
+def load_columns(plan, consumers=None, parse_jobs=1, errors=None):
+    """
+    Loads all planned columns, reading every csv file in a single pass
+    Arguments:
+        plan: Dict where key = csv filename, value = dict where key = column, value = dtype (see plan_columns)
+        consumers: Optional dict where key = csv filename, value = list of tuples of (column, sink, preprocessing function)
+        where each chunk of the column is added to the sink while the file is read (see plan_streams)
+        parse_jobs: Amount of processes that parse parts of each csv file in parallel
+        errors: Optional dict, a file that fails to load (e.g. it is missing) is stored in it as
+        key = csv filename, value = the exception, and the other files are still loaded. Columns that a file
+        doesn't have are stored as key = tuple of (csv filename, column). Raised if None.
+    Returns: Dict where key = tuple of (csv filename, column), value = numpy array of the column
+    """
+    if consumers is None:
+        consumers = {}
+    columns = {}
+    for csv_file in list(plan) + [f for f in consumers if f not in plan]:
+        columns_dtypes = plan.get(csv_file, {})
+        file_consumers = consumers.get(csv_file, [])
+        try:
+            if errors is not None:
+                (columns_dtypes, file_consumers) = drop_missing_columns(
+                    csv_file, columns_dtypes, file_consumers, errors)
+            while True:
+                try:
+                    with span('load', csv_file, nbytes=os.path.getsize(csv_file)) as record:
+                        loaded = load_columns_from_file(csv_file, list(columns_dtypes), file_consumers,
+                                                        workers=parse_jobs, dtypes=columns_dtypes)
+                        if loaded:
+                            record['rows'] = max(len(values) for values in loaded.values())
+                    break
+                except DtypeError as e:
+                    if errors is None or e.column not in columns_dtypes:
+                        raise
+                    # Only the series that read the column fail, the file is read again without it
+                    print(f"Could not load column '{e.column}' of {csv_file}: {e}", file=sys.stderr)
+                    errors[(csv_file, e.column)] = e
+                    columns_dtypes = {column: dtype for column, dtype in columns_dtypes.items()
+                                      if column != e.column}
+        except Exception as e:
+            if errors is None:
+                raise
+            print(f'Could not load {csv_file}: {e}', file=sys.stderr)
+            errors[csv_file] = e
+            continue
+        for column, values in loaded.items():
+            columns[(csv_file, column)] = values
+    return columns
+
+
+def drop_missing_columns(csv_file, columns_dtypes, file_consumers, errors):
+    """
+    Leaves out the planned columns that a csv file doesn't have, so its other columns can still be loaded
+    Arguments:
+        csv_file: Name of the csv file
+        columns_dtypes: Dict where key = column, value = dtype (see plan_columns)
+        file_consumers: List of tuples of (column, sink, preprocessing function) (see plan_streams)
+        errors: Dict the missing columns are stored in as key = tuple of (csv filename, column), value = exception
+    Returns: Tuple of columns_dtypes and file_consumers without the missing columns
+    """
+    if csv_file.endswith('.npy'):
+        # A converted column file holds a single column under any name
+        return columns_dtypes, file_consumers
+    header = set(read_csv_header(csv_file))
+
+    def missing(names):
+        absent = [name for name in names if name not in header]
+        for name in absent:
+            if (csv_file, name) not in errors:
+                errors[(csv_file, name)] = ValueError(f"{csv_file} has no column '{name}'")
+                print(f"Could not load column '{name}' of {csv_file}: not in the header", file=sys.stderr)
+        return absent
+
+    columns_dtypes = {column: dtype for column, dtype in columns_dtypes.items() if not missing([column])}
+    file_consumers = [consumer for consumer in file_consumers if not missing(consumer_columns(consumer[0]))]
+    return columns_dtypes, file_consumers
+
+
+def handle_preprocessing(value, columns=None, uses=None):
     """
     Handles the preprocessing of a tuple(csv filename, column, preprocessing function)
     Arguments:
-        value: tuple of (csv filename, column, preprocessing function)
-    Returns: A List of floats which represent the column in the csv file,
+        value: tuple of (csv filename, column, preprocessing function, optional dict of options)
+        columns: Optional dict of already loaded columns (see load_columns),
+        preprocessed results are stored in it as well so repeated tuples are only processed once
+        uses: Optional Counter of the remaining uses of the columns (see column_uses), decremented for the columns
+        the call reads. Preprocessed results are only stored if they are used again, and columns are removed from the dict
+        after their last use, so they can be freed before all series are done.
+    Returns: A numpy array which represents the column in the csv file (float64 unless the 'dtype' option is given),
     if preprocessing function is given it will be run through that as well.
+    The column may be loaded in a wider dtype for other series (see merge_dtypes), it is converted to the declared one.
+    Raises: DtypeError if the values don't fit in the declared dtype
+    """
+    if columns is None:
+        columns = {}
+    csv_file, column_name, func, options = parse_column_spec(value)
+    (raw_key, key) = column_keys(value)
+    if uses is not None:
+        uses[key] -= 1
+        if key != raw_key and key not in columns:
+            # The raw column is only read to compute the preprocessed one
+            uses[raw_key] -= 1
+
+    def keep(column_key):
+        return uses is None or uses[column_key] > 0
+
+    if key in columns:
+        result = columns[key]
+    else:
+        result = columns.get(raw_key)
+        if result is None:
+            result = get_from_csv(csv_file, column_name)
+            columns[raw_key] = result
+        if 'dtype' in options and result.dtype != np.dtype(options['dtype']):
+            check_dtype(result, options['dtype'], column_name)
+            result = result.astype(options['dtype'])
+        if func is not None:
+            with span('preprocess', getattr(func, '__name__', repr(func)), rows=len(result)):
+                # Functions that still return lists are converted back to an array
+                result = np.asarray(func(result))
+        if key != raw_key and keep(key):
+            columns[key] = result
+    for column_key in {raw_key, key}:
+        if not keep(column_key):
+            columns.pop(column_key, None)
+    return result
+
+
+def parse_hgrm_spec(value):
+    """
+    Splits a value of the hgrm_map into its parts
+    Arguments:
+        value: File name or glob pattern of .hgrm or .hlog files, a list of those,
+        or tuple of (any of those, dict of options)
+    Returns: Tuple of (list of file names and glob patterns, dict of options)
+    """
+    options = {}
+    if isinstance(value, tuple):
+        value, options = value
+    if isinstance(value, str):
+        value = [value]
+    return list(value), options
+
+
+def is_merged(sources):
+    """
+    Arguments:
+        sources: List of file names and glob patterns of a value in the hgrm_map
+    Returns: True if the series is merged from histogram counts, False for a single .hgrm table
+    """
+    return (len(sources) != 1 or strip_compression(sources[0]).endswith('.hlog')
+            or glob.escape(sources[0]) != sources[0])
+
+
+def load_hgrm_series(value, np_sample_points, parse_jobs=1):
+    """
+    Gets the percentiles of the histogram files of a value in the hgrm_map
+    A single .hgrm file is plotted from its percentile table, several files (or .hlog files) are merged
+    on their bucket counts and read at the sample points, so they line up with the csv series.
+    Arguments:
+        value: Value in the hgrm_map, see parse_hgrm_spec. Options are 'start' and 'end' (seconds since the start
+        of the log) and 'tag' for .hlog files, 'significant_digits' for .hgrm files and 'unit_ratio' for both
+        np_sample_points: numpy array of percentages
+        parse_jobs: Amount of processes that decode histogram files in parallel
+    Returns: Tuple of 1. numpy array of latencies, 2. numpy array of corresponding percentages
+    """
+    sources, options = parse_hgrm_spec(value)
+    if not is_merged(sources):
+        with span('hgrm', sources[0], nbytes=os.path.getsize(sources[0])):
+            return parse_hgrm(sources[0])
+    with span('hgrm', ', '.join(sources)) as record:
+        histogram = merge_histograms(sources, options, parse_jobs)
+        record['bytes'] = sum(os.path.getsize(filename)
+                              for filename in expand_sources(sources))
+        record['rows'] = histogram.total_count
+    return histogram.percentiles(np_sample_points)[0], np_sample_points
+
+
+def series_order(config):
+    """
+    Arguments:
+        config: The imported config module
+    Returns: List of all labels in the config in plotting order
+    """
+    return list(config.label_map) + list(config.combined_columns) + \
+        list(getattr(config, 'hgrm_map', {}))
+
+
+def series_cache_keys(config, np_sample_points, labels, cache):
+    """
+    Gets the cache keys of the series in a config
+    A key covers the identity of the source files, the columns, the functions, the options and the sample points,
+    but not the label or any plot setting.
+    Arguments:
+        config: The imported config module
+        np_sample_points: numpy array of percentages
+        labels: Optional collection of labels, all series in the config if None
+        cache: PercentileCache
+    Returns: Dict where key = label, value = cache key, series that can't be cached are left out
+    """
+    sample_points = np.asarray(np_sample_points).tolist()
+
+    def column_description(value):
+        csv_file, column, func, options = parse_column_spec(value)
+        return [file_identity(csv_file), column, function_identity(func),
+                {option: setting for option, setting in options.items() if option != 'hgrm_out'}]
+
+    descriptions = {}
+    for label, value in config.label_map.items():
+        options = parse_column_spec(value)[3]
+        # The hgrm file is written as a side effect of computing the series
+        if 'hgrm_out' in options and not os.path.exists(options['hgrm_out']):
+            continue
+        descriptions[label] = lambda value=value: [
+            'column', column_description(value), sample_points]
+    for label, pair in config.combined_columns.items():
+        descriptions[label] = lambda pair=pair: ['combined', function_identity(pair[0]),
+                                                 [column_description(value) for value in pair[1]], sample_points]
+    for label, hgrm_value in getattr(config, 'hgrm_map', {}).items():
+        sources, options = parse_hgrm_spec(hgrm_value)
+        descriptions[label] = lambda sources=sources, options=options: [
+            'hgrm', [file_identity(filename) for filename in expand_sources(sources)], options, sample_points]
+
+    keys = {}
+    for label, description in descriptions.items():
+        if labels is not None and label not in labels:
+            continue
+        try:
+            keys[label] = cache.key([CACHE_VERSION] + description())
+        except OSError:
+            # Missing files are reported when the series is computed
+            pass
+    return keys
+
+
+def series_percentiles(label, value, combined, columns, np_sample_points, uses=None):
+    """
+    Computes the percentiles of a series that is not streamed
+    Arguments:
+        label: Label of the series
+        value: Value in the label_map, or pair of (combination function, list of values) in the combined_columns
+        combined: Whether value is a pair of the combined_columns
+        columns: Dict of loaded columns (see load_columns), preprocessed columns are stored in it too
+        np_sample_points: numpy array of percentages
+        uses: Optional Counter of the remaining uses of the columns (see handle_preprocessing)
+    Returns: numpy array of percentiles
+    """
+    with span('series', label) as record:
+        if not combined:
+            column = handle_preprocessing(value, columns, uses)
+            record['rows'] = len(column)
+            with span('percentiles', label, rows=len(column)):
+                return get_percentiles(column, np_sample_points)
+
+        # Get list of latencies to combine
+        columns_list = [handle_preprocessing(
+            column_value, columns, uses) for column_value in value[1]]
+        # Combine the latencies and get percentiles
+        func = value[0]
+        with span('combine', label) as combine_record:
+            combined_column = combine(func, *columns_list)
+            combine_record['rows'] = record['rows'] = len(combined_column)
+        # The combined array is owned here so it can be partitioned in place
+        with span('percentiles', label, rows=len(combined_column)):
+            return get_percentiles(combined_column, np_sample_points, overwrite_input=True)
+
+
+def series_columns(value, combined, shared_columns):
+    """
+    Arguments:
+        value, combined: See series_percentiles
+        shared_columns: Dict where key = tuple of (csv filename, column), value = SharedArray
+    Returns: Dict with the shared columns the series reads
+    """
+    values = value[1] if combined else [value]
+    keys = [parse_column_spec(column_value)[:2] for column_value in values]
+    return {key: shared_columns[key] for key in keys}
+
+
+def shared_series_percentiles(label, value, combined, shared_columns, np_sample_points):
+    """
+    Computes the percentiles of a series in a worker process, attached to columns in shared memory
+    Arguments:
+        label, value, combined, np_sample_points: See series_percentiles
+        shared_columns: Dict where key = tuple of (csv filename, column), value = SharedArray (see series_columns)
+    Returns: numpy array of percentiles
+    """
+    columns = {}
+    blocks = []
+    try:
+        for key, shared_array in shared_columns.items():
+            (columns[key], block) = attach(shared_array)
+            blocks.append(block)
+        return series_percentiles(label, value, combined, columns, np_sample_points)
+    finally:
+        # Arrays attached to the blocks have to be gone before the blocks are closed
+        columns.clear()
+        detach(blocks)
+
+
+def is_picklable(value):
+    """
+    Arguments:
+        value: Value in the label_map or pair in the combined_columns
+    Returns: True if it can be sent to a worker process, lambdas and nested functions can't
+    """
+    try:
+        pickle.dumps(value)
+    except (pickle.PicklingError, AttributeError, TypeError):
+        return False
+    return True
+
+
+def report_failure(label, error):
+    """
+    Reports a series that is left out of the plot
+    Arguments:
+        label: Label of the series
+        error: The exception that made it fail
+    """
+    print(f'Skipping {label}: {type(error).__name__}: {error}', file=sys.stderr)
+
+
+class SeriesPlan:
+    """
+    The series of a config that still have to be computed, with the columns and streams they need.
+    Loading the columns is left to the caller, so configs that read the same csv files can share
+    a single pass over them (see compute_batch).
+    """
+
+    def __init__(self, config, np_sample_points, labels=None, cache=None):
+        """
+        Arguments:
+            config: The imported config module
+            np_sample_points: numpy array of percentages to get the percentiles of the csv columns at
+            labels: Optional collection of labels to compute, all series in the config if None
+            cache: Optional PercentileCache, cached series are not computed again and computed series are stored in it
+        """
+        self.config = config
+        self.np_sample_points = np_sample_points
+        self.cache = cache
+        self.keys = {}
+        self.cached = {}
+        if cache is not None:
+            with span('cache', 'get'):
+                self.keys = series_cache_keys(config, np_sample_points, labels, cache)
+                for label, key in self.keys.items():
+                    entry = cache.get(key)
+                    if entry is not None:
+                        self.cached[label] = entry
+
+        def selected(mapping):
+            return {label: value for label, value in mapping.items()
+                    if (labels is None or label in labels) and label not in self.cached}
+
+        # Get mappings
+        self.label_map = selected(config.label_map)
+        self.combined_columns = selected(config.combined_columns)
+        self.hgrm_map = selected(getattr(config, 'hgrm_map', {}))
+
+        try:
+            # Every csv file is read once for all columns referenced in the config,
+            # sketched columns are streamed into their sketch or histogram during the same pass
+            self.sinks, self.consumers = plan_streams(self.label_map)
+            self.plan = plan_columns(self.label_map, self.combined_columns)
+            self.uses = column_uses(self.label_map, self.combined_columns)
+            self.plan_error = None
+        except Exception as e:
+            # E.g. a malformed column tuple, the csv series are reported as failed in finish
+            self.sinks, self.consumers, self.plan = {}, {}, {}
+            self.uses = collections.Counter()
+            self.plan_error = e
+
+    def files(self):
+        """
+        Returns: Set of the csv files the series read
+        """
+        return set(self.plan) | set(self.consumers)
+
+    def finish(self, columns, parse_jobs=1, pool=None, uses=None, errors=None):
+        """
+        Computes the percentiles once the columns are loaded and the streams are consumed
+        A series that fails (e.g. its file could not be loaded) is reported and left out, the others are still computed.
+        Arguments:
+            columns: Dict of loaded columns (see load_columns)
+            parse_jobs: Amount of processes that decode histogram files in parallel
+            pool: Optional process pool that computes the series in parallel. The columns are moved into shared
+            memory that the workers attach to, so they are neither pickled nor copied per series,
+            and the dict is emptied when done.
+            uses: Optional Counter of the remaining uses of the columns by all series that share them
+            (see column_uses), defaults to the uses of this plan. Columns are dropped from the dict after their last use.
+            errors: Optional dict where key = csv filename, value = exception of the files that failed to load
+            (see load_columns), the series that read them are left out
+        Returns: Same as compute_series
+        """
+        if uses is None:
+            uses = collections.Counter(self.uses)
+        if errors is None:
+            errors = {}
+        np_sample_points = self.np_sample_points
+        sinks = self.sinks
+
+        # Dict where key = label, value = percentiles
+        perc_map = {}
+
+        percentage_map = {}
+
+        # Dict where key = label, value = text shown next to the label in the legend
+        annotations = {}
+
+        # Dict where key = label, value = numpy array with the start of every window of a windowed series
+        window_map = {}
+
+        # Dicts where key = label, value = future of a series that is computed by the pool
+        futures = {}
+        hgrm_futures = {}
+
+        def load_error(values):
+            if self.plan_error is not None:
+                return self.plan_error
+            for value in values:
+                csv_file, column, _, options = parse_column_spec(value)
+                for key in (csv_file, (csv_file, column), (csv_file, options.get('timestamp'))):
+                    if key in errors:
+                        return errors[key]
+            return None
+
+        shared = None
+        try:
+            if pool is not None:
+                shared = SharedColumns()
+                shared_columns = shared.share_columns(columns)
+
+            # Individual columns
+            for label, value in self.label_map.items():
+                try:
+                    error = load_error([value])
+                    if error is not None:
+                        raise error
+                    if label in sinks:
+                        options = parse_column_spec(value)[3]
+                        with span('percentiles', label):
+                            (percentiles, relative_errors) = sinks[label].percentiles(
+                                np_sample_points)
+                        perc_map[label] = percentiles
+                        if 'sketch' in options:
+                            annotations[label] = f'±{100 * relative_errors.max():.2g}%'
+                            print(
+                                f'{label}: estimated with relative error up to {annotations[label]}')
+                        if 'window' in options:
+                            window_map[label] = sinks[label].starts()
+                        if 'hgrm_out' in options:
+                            # Later plots can use the histogram through the hgrm_map without the raw data
+                            sinks[label].write_hgrm(options['hgrm_out'])
+                        percentage_map[label] = np_sample_points
+                    elif shared is not None and is_picklable(value):
+                        futures[label] = pool.submit(shared_series_percentiles, label, value, False,
+                                                     series_columns(value, False, shared_columns), np_sample_points)
+                    else:
+                        perc_map[label] = series_percentiles(
+                            label, value, False, columns, np_sample_points, uses)
+                        percentage_map[label] = np_sample_points
+                except Exception as e:
+                    report_failure(label, e)
+
+            # Combined columns
+            for label, pair in self.combined_columns.items():
+                try:
+                    error = load_error(pair[1])
+                    if error is not None:
+                        raise error
+                    if shared is not None and is_picklable(pair):
+                        futures[label] = pool.submit(shared_series_percentiles, label, pair, True,
+                                                     series_columns(pair, True, shared_columns), np_sample_points)
+                    else:
+                        perc_map[label] = series_percentiles(
+                            label, pair, True, columns, np_sample_points, uses)
+                        percentage_map[label] = np_sample_points
+                except Exception as e:
+                    report_failure(label, e)
+
+            for label, hgrm_value in self.hgrm_map.items():
+                try:
+                    if pool is not None:
+                        hgrm_futures[label] = pool.submit(
+                            load_hgrm_series, hgrm_value, np_sample_points, parse_jobs)
+                    else:
+                        (latencies, percentiles) = load_hgrm_series(
+                            hgrm_value, np_sample_points, parse_jobs)
+                        perc_map[label] = latencies
+                        percentage_map[label] = percentiles
+                except Exception as e:
+                    report_failure(label, e)
+
+            for label, future in futures.items():
+                try:
+                    perc_map[label] = future.result()
+                    percentage_map[label] = np_sample_points
+                except Exception as e:
+                    report_failure(label, e)
+            for label, future in hgrm_futures.items():
+                try:
+                    (perc_map[label], percentage_map[label]) = future.result()
+                except Exception as e:
+                    report_failure(label, e)
+        finally:
+            if shared is not None:
+                # The columns are views of the shared memory, which is released now
+                columns.clear()
+                shared.close()
+
+        if self.cache is not None:
+            with span('cache', 'put'):
+                for label in perc_map:
+                    if label in self.keys:
+                        self.cache.put(self.keys[label], perc_map[label],
+                                       percentage_map[label], annotations.get(label), window_map.get(label))
+        for label, (percentiles, percentages, annotation, windows) in self.cached.items():
+            perc_map[label] = percentiles
+            percentage_map[label] = percentages
+            if annotation is not None:
+                annotations[label] = annotation
+            if windows is not None:
+                window_map[label] = windows
+
+        # Keep the config order, cached series would otherwise come last
+        perc_map = {label: perc_map[label]
+                    for label in series_order(self.config) if label in perc_map}
+        return perc_map, percentage_map, annotations, window_map
+
+
+def compute_series(config, np_sample_points, labels=None, parse_jobs=1, cache=None):
+    """
+    Computes the percentiles of the series defined in a config
+    Arguments:
+        config: The imported config module
+        np_sample_points: numpy array of percentages to get the percentiles of the csv columns at
+        labels: Optional collection of labels to compute, all series in the config if None
+        parse_jobs: Amount of processes that parse parts of each csv file in parallel
+        cache: Optional PercentileCache, cached series are not computed again and computed series are stored in it
+    Returns: Tuple of dicts where key = label and value = 1. percentiles, 2. percentages, 3. legend annotation,
+    4. start of every window for windowed series, whose percentiles have a row per window
+    """
+    series = SeriesPlan(config, np_sample_points, labels, cache)
+    errors = {}
+    columns = load_columns(series.plan, series.consumers, parse_jobs, errors)
+    return series.finish(columns, parse_jobs, errors=errors)
+
+
+def group_by_files(files):
+    """
+    Groups keys that (transitively) share a file
+    Arguments:
+        files: Dict where key = anything, value = set of file names
+    Returns: List of lists of keys, in the order of files
+    """
+    groups = []
+    for key, key_files in files.items():
+        # Merge all existing groups that share a file with this key
+        overlapping = [group for group in groups if group[1] & key_files]
+        merged = ([key], set(key_files))
+        for group in overlapping:
+            groups.remove(group)
+            merged = (group[0] + merged[0], group[1] | merged[1])
+        groups.append(merged)
+    return [group[0] for group in groups]
+
+
+def group_series(config):
+    """
+    Groups the series of a config so that series reading the same csv file are in the same group,
+    every group can then be computed independently while each file is still read once
+    Arguments:
+        config: The imported config module
+    Returns: List of lists of labels
     """
-    csv_file = value[0]
-    column_name = value[1]
-    result = get_from_csv(csv_file, column_name)
-    if len(value) > 2:
-        func = value[2]
-        result = func(result)
+    files = {}
+    for label, value in config.label_map.items():
+        files[label] = {value[0]}
+    for label, pair in config.combined_columns.items():
+        files[label] = {value[0] for value in pair[1]}
+
+    result = group_by_files(files)
+    # Every hgrm file is its own group
+    result.extend([label] for label in getattr(config, 'hgrm_map', {}))
     return result
 
 
+def compute_group(config_name, labels, np_sample_points, parse_jobs=1, cache=None):
+    """
+    Computes a group of series in a worker process (see group_series)
+    Arguments:
+        config_name: Module name of the config, the worker imports it itself
+        labels: List of labels to compute
+        np_sample_points: numpy array of percentages
+        parse_jobs: Amount of processes that parse parts of each csv file in parallel
+        cache: Optional PercentileCache
+    Returns: Same as compute_series
+    """
+    config = importlib.import_module(config_name)
+    return compute_series(config, np_sample_points, set(labels), parse_jobs, cache)
+
+
+def compute_series_parallel(config_name, config, np_sample_points, jobs, parse_jobs=1, cache=None):
+    """
+    Computes the series of a config in a process pool, only the percentiles are sent back to this process
+    Arguments:
+        config_name: Module name of the config
+        config: The imported config module
+        np_sample_points: numpy array of percentages
+        jobs: Amount of worker processes
+        parse_jobs: Amount of processes each worker uses to parse parts of a csv file in parallel
+        cache: Optional PercentileCache
+    Returns: Same as compute_series, in the same order as a serial run
+    """
+    groups = group_series(config)
+    if len(groups) < jobs:
+        # Not enough independent groups to keep the workers busy (e.g. all series read the same csv file),
+        # so the columns are loaded once here and the series are spread over the workers through shared memory
+        series = SeriesPlan(config, np_sample_points, cache=cache)
+        errors = {}
+        columns = load_columns(series.plan, series.consumers, parse_jobs, errors)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            return series.finish(columns, parse_jobs, pool, errors=errors)
+
+    perc_map = {}
+    percentage_map = {}
+    annotations = {}
+    window_map = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = pool.map(compute_group, itertools.repeat(config_name), groups,
+                           itertools.repeat(np_sample_points), itertools.repeat(parse_jobs),
+                           itertools.repeat(cache))
+        for group_perc, group_percentage, group_annotations, group_windows in results:
+            perc_map.update(group_perc)
+            percentage_map.update(group_percentage)
+            annotations.update(group_annotations)
+            window_map.update(group_windows)
+
+    # Restore the config order so the legend and colors don't depend on which worker finished first
+    perc_map = {label: perc_map[label]
+                for label in series_order(config) if label in perc_map}
+    return perc_map, percentage_map, annotations, window_map
+
+
+def split_windowed_series(config, perc_map, percentage_map, window_map):
+    """
+    Takes the windowed series out of the computed series
+    With the 'window_plot': 'lines' option every window becomes a line in the percentile plot,
+    otherwise the series goes to the percentile over time plot.
+    Arguments:
+        config: The imported config module
+        perc_map: Dict where key = label, value = percentiles (a row per window for windowed series)
+        percentage_map: Dict where key = label, value = percentages
+        window_map: Dict where key = label, value = numpy array with the start of every window
+    Returns: Tuple of 1. perc_map, 2. percentage_map without windowed series but with a label per window line,
+    3. dict where key = label, value = tuple of (window starts, percentages, percentiles) for the over time plot
+    """
+    lines = {}
+    new_percentage_map = {}
+    over_time = {}
+    for label, percentiles in perc_map.items():
+        if label not in window_map:
+            lines[label] = percentiles
+            new_percentage_map[label] = percentage_map[label]
+        elif parse_column_spec(config.label_map[label])[3].get('window_plot') == 'lines':
+            for start, row in zip(window_map[label], percentiles):
+                lines[f'{label} @{start:g}'] = row
+                new_percentage_map[f'{label} @{start:g}'] = percentage_map[label]
+        else:
+            over_time[label] = (window_map[label], percentage_map[label], percentiles)
+    return lines, new_percentage_map, over_time
+
+
 def main(args):
     """
     Main function, program entrypoint
     Arguments:
         args: The program arguments (excluding first argument which is the file being executed)
     """
+    if len(args) > 0 and args[0] == 'convert':
+        convert(args[1:])
+        return
+    if len(args) > 0 and args[0] == 'batch':
+        batch(args[1:])
+        return
+
     params = parse_args(args)
+    profiler = start_profiler(params)
+    try:
+        run(params)
+    finally:
+        report_profile(profiler, params)
+
+
+def run(params):
+    """
+    Computes, exports and renders the config of the main command
+    Arguments:
+        params: The parsed arguments (see parse_args)
+    """
     config_name = params.config
 
     # Print config we are using
@@ -105,6 +1424,100 @@ def main(args):
     # Import config as module
     config = importlib.import_module(config_name)
 
+    np_sample_points = get_sample_points(config.num_intervals)
+
+    if params.follow:
+        follow_series(config, np_sample_points, params.interval,
+                      output=output_settings(config, params))
+        return
+
+    # Cache of computed percentiles, so re-rendering only has to read the sources again when they changed
+    cache = PercentileCache(params.cache_dir, params.cache_size * 1024 * 1024)
+    if params.clear_cache:
+        cache.clear()
+    if params.no_cache:
+        cache = None
+
+    if params.jobs > 1:
+        # The stages run in worker processes, so only the whole computation is recorded
+        with span('compute', config_name):
+            (perc_map, percentage_map, annotations, window_map) = compute_series_parallel(
+                config_name, config, np_sample_points, params.jobs, params.parse_jobs, cache)
+    else:
+        (perc_map, percentage_map, annotations, window_map) = compute_series(
+            config, np_sample_points, parse_jobs=params.parse_jobs, cache=cache)
+
+    for export_filename in params.export:
+        with span('export', export_filename) as record:
+            export_series(export_filename, perc_map,
+                          percentage_map, annotations, window_map)
+            record['bytes'] = os.path.getsize(export_filename)
+        print(f'Exported {export_filename}')
+
+    if not params.no_plot:
+        render(config, np_sample_points, perc_map,
+               percentage_map, annotations, window_map, output_settings(config, params))
+
+    return
+
+
+def get_sample_points(num_intervals):
+    """
+    Arguments:
+        num_intervals: The number of intervals to display
+    Returns: numpy array of the percentages at which to sample the intervals
+    """
+    total_sample_points = INTERVAL_SAMPLE_POINTS.copy()
+    for i in range(1, num_intervals):
+        final_point = total_sample_points[-1]
+        total_sample_points.extend(
+            [final_point + j/(10.0 ** i) for j in INTERVAL_SAMPLE_POINTS])
+    return np.array(total_sample_points)
+
+
+def thin_points(percentages, percentiles, max_points):
+    """
+    Thins a line to at most max_points points, evenly spaced on the nines axis of the plot
+    (90% -> 1, 99% -> 2, 99.9% -> 3, etc.). The first and last point (the extreme tail) and the maximum
+    are always kept.
+    Arguments:
+        percentages: numpy array of increasing percentages
+        percentiles: numpy array of the percentiles at the percentages
+        max_points: Maximum amount of points, None to keep all points
+    Returns: Tuple of 1. numpy array of the kept percentages, 2. numpy array of the corresponding percentiles
+    """
+    percentages = np.asarray(percentages, dtype=np.float64)
+    percentiles = np.asarray(percentiles)
+    if max_points is None or len(percentages) <= max_points or np.any(np.diff(percentages) < 0):
+        return percentages, percentiles
+    with np.errstate(divide='ignore'):
+        nines = -np.log10(1.0 - np.minimum(percentages, 100.0) / 100.0)
+    always = np.unique([0, len(percentages) - 1, int(np.argmax(percentiles))])
+    # 100% is at infinity on the nines axis, it can only be the last point which is kept anyway
+    finite = nines[:np.count_nonzero(np.isfinite(nines))]
+    if len(finite) < 2:
+        return percentages[always], percentiles[always]
+    targets = np.linspace(finite[0], finite[-1], max(max_points - len(always), 2))
+    # Nearest point to every target
+    right = np.clip(np.searchsorted(finite, targets), 1, len(finite) - 1)
+    nearest = np.where(targets - finite[right - 1] <= finite[right] - targets, right - 1, right)
+    kept = np.union1d(nearest, always)
+    return percentages[kept], percentiles[kept]
+
+
+def render(config, np_sample_points, perc_map, percentage_map, annotations, window_map, output=None):
+    """
+    Plots the computed series of a config
+    Arguments:
+        config: The imported config module
+        np_sample_points: numpy array of percentages (see get_sample_points)
+        perc_map, percentage_map, annotations, window_map: Computed series (see compute_series)
+        output: Optional dict of output settings, defaults to the settings of the config (see output_settings)
+    """
+    if output is None:
+        output = output_settings(config)
+    # Imported here so runs that don't plot (--no-plot) never import matplotlib and seaborn
+    from plotting import plot_percentiles_multiple, plot_percentiles_over_time
     # Get plot details
     plot_title = config.title
     x_axis_label = config.x_axis_label
@@ -113,176 +1526,124 @@ def main(args):
     dark_mode = config.dark_mode
     y_log = config.y_log
 
-    # Get number of intervals
-    num_intervals = config.num_intervals
-
-    # Get sample points at which to sample intervals
-    sample_points = [15.0, 30.0, 50.0, 60.0, 70.0, 80.0, 90.0]
-    total_sample_points = sample_points.copy()
-    for i in range(1, num_intervals):
-        final_point = total_sample_points[-1]
-        total_sample_points.extend(
-            [final_point + j/(10.0 ** i) for j in sample_points])
-    np_sample_points = np.array(total_sample_points)
-
     # Get file names
     filename = config.file_name
 
     # Get line formats
     line_formats = config.label_line
 
-    # Get mappings
-    label_map = config.label_map
-    combined_columns = config.combined_columns
+    (perc_map, percentage_map, over_time) = split_windowed_series(
+        config, perc_map, percentage_map, window_map)
 
-    # Dict where key = label, value = percentiles
-    perc_map = {}
+    for label in perc_map:
+        (percentage_map[label], perc_map[label]) = thin_points(
+            percentage_map[label], perc_map[label], output['max_points'])
 
-    percentage_map = {}
+    # Plot the percentiles
+    with span('render', filename, rows=sum(len(percentiles) for percentiles in perc_map.values())):
+        plot_percentiles_multiple(plot_title, perc_map, percentage_map, filename, config.num_intervals,
+                                  y_log, line_formats, x_axis_label, y_axis_label, font_scale, dark_mode,
+                                  annotations, output)
+
+    if over_time:
+        # 50% and the end of every interval (90%, 99%, 99.9%, etc.)
+        over_time_indices = [2] + list(range(len(INTERVAL_SAMPLE_POINTS) - 1,
+                                             len(np_sample_points), len(INTERVAL_SAMPLE_POINTS)))
+        (root, extension) = os.path.splitext(filename)
+        with span('render', f'{root}_over_time{extension}'):
+            plot_percentiles_over_time(plot_title, over_time, over_time_indices, f'{root}_over_time{extension}',
+                                       y_log, y_axis_label, font_scale, dark_mode, output)
+
+
+def followed_value(value):
+    """
+    Arguments:
+        value: column tuple (see parse_column_spec)
+    Returns: The column tuple, recorded into a QuantileSketch if it isn't streamed already. Unlike a HdrHistogram
+    the sketch doesn't round to integers, so it works for any unit without a 'unit_ratio'.
+    """
+    if is_streamed(value):
+        return value
+    csv_file, column, func, options = parse_column_spec(value)
+    return (csv_file, column) + (() if func is None else (func,)) + ({'sketch': FOLLOW_SKETCH_ACCURACY, **options},)
 
-    try:
-        # Individual columns
-        for label, value in label_map.items():
-            column = handle_preprocessing(value)
-            perc_map[label] = get_percentiles(column, np_sample_points)
-            percentage_map[label] = np_sample_points
-
-        # Combined columns
-        for label, pair in combined_columns.items():
-            # Get list of latencies to combine
-            columns_list = [handle_preprocessing(value) for value in pair[1]]
-            # Combine the latencies and get percentiles
-            func = pair[0]
-            perc_map[label] = get_percentiles(
-                combine(func, *columns_list), np_sample_points)
-            percentage_map[label] = np_sample_points
-    except:
-        pass
 
+def follow_series(config, np_sample_points, interval, refreshes=None, output=None):
+    """
+    Follows the csv files of a config while they grow and re-renders the plot every interval
+    Every refresh only parses the rows appended since the previous one, into histograms and sketches
+    that are kept between refreshes. Columns without a 'sketch', 'hdr' or 'window' option are recorded into
+    a QuantileSketch with 1% relative accuracy. Combined columns are left out, hgrm series are read once.
+    Arguments:
+        config: The imported config module
+        np_sample_points: numpy array of percentages
+        interval: Seconds between refreshes
+        refreshes: Optional amount of refreshes after which to stop, follows until interrupted if None
+        output: Optional dict of output settings (see output_settings)
+    """
+    if config.combined_columns:
+        print(f'Not following combined columns: {", ".join(config.combined_columns)}')
+    label_map = {label: followed_value(value)
+                 for label, value in config.label_map.items()}
+    (hgrm_perc_map, hgrm_percentage_map, _, _) = compute_series(
+        config, np_sample_points, set(getattr(config, 'hgrm_map', {})))
+
+    sinks, consumers = plan_streams(label_map)
+    # Dict where key = csv filename, value = byte offset up to which the file is processed
+    offsets = {}
+    count = 0
     try:
-        hgrm_columns = config.hgrm_map
-        for label, hgrm_filename in hgrm_columns.items():
-            (latencies, percentiles) = parse_hgrm(hgrm_filename)
-            perc_map[label] = latencies
-            percentage_map[label] = percentiles
-    except:
-        pass
+        while refreshes is None or count < refreshes:
+            if any(os.path.getsize(csv_file) < offset for csv_file, offset in offsets.items()):
+                # A file was truncated or rewritten, e.g. the benchmark restarted, so start over
+                print('Source file shrunk, reading all files again')
+                sinks, consumers = plan_streams(label_map)
+                offsets = {}
+            for csv_file, file_consumers in consumers.items():
+                offsets[csv_file] = follow_csv(
+                    csv_file, file_consumers, offsets.get(csv_file))
 
-    # Plot the percentiles
-    plot_percentiles_multiple(plot_title, perc_map, percentage_map, filename, num_intervals,
-                              y_log, line_formats, x_axis_label, y_axis_label, font_scale, dark_mode)
+            perc_map = {}
+            percentage_map = dict(hgrm_percentage_map)
+            annotations = {}
+            window_map = {}
+            for label, value in label_map.items():
+                if not has_values(sinks[label]):
+                    # Nothing appended yet
+                    continue
+                options = parse_column_spec(value)[3]
+                (percentiles, errors) = sinks[label].percentiles(
+                    np_sample_points)
+                perc_map[label] = percentiles
+                percentage_map[label] = np_sample_points
+                if 'sketch' in options:
+                    annotations[label] = f'±{100 * errors.max():.2g}%'
+                if 'window' in options:
+                    window_map[label] = sinks[label].starts()
+            perc_map.update(hgrm_perc_map)
 
-    return
+            render(config, np_sample_points, perc_map,
+                   percentage_map, annotations, window_map, output)
+            count += 1
+            print(f'Refreshed {config.file_name}: '
+                  + ', '.join(f'{csv_file} at byte {offset}' for csv_file, offset in offsets.items()), flush=True)
+            if refreshes is None or count < refreshes:
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
 
 
-def plot_percentiles_multiple(title, percentiles_map, percentages_map, filename, num_intervals, y_log, line_formats, x_axis_label, y_axis_label, font_scale, dark_mode):
+def has_values(sink):
     """
-    Plot function for the given percentiles
-    Adapted from https://stackoverflow.com/questions/42072734/percentile-distribution-graph
     Arguments:
-        title: Title of the plot
-        percentiles_map: Dict where key is label and value are percentiles
-        percentages_map: Dict where key is label and value list of percentages used
-        filename: The destination file name of the output image
-        num_intervals: The number of intervals to display
-        y_log: True will display y axis on log scale, False will use linear scale
-        line_formats: Dict where key is label and value is tuple of (marker, linestyle, color) for plot
-        x_axis_label: Label below x axis
-        y_axis_label: Label to the left of y axis
-        font_scale: Scale of font, 1 is normal
-        dark_mode: Whether to use dark mode
-    """
-    # Reset sns before every plot
-    sns.reset_defaults()
-
-    clear_bkgd = {
-        'axes.facecolor': 'none',
-        'figure.facecolor': 'none'
-    }
-
-    # Dark mode
-    if dark_mode:
-        dark_text_color = 'white'
-
-        clear_bkgd['text.color'] = dark_text_color
-        clear_bkgd['axes.labelcolor'] = dark_text_color
-        clear_bkgd['xtick.color'] = dark_text_color
-        clear_bkgd['ytick.color'] = dark_text_color
-
-        sns.set(style='darkgrid', font_scale=font_scale,
-                palette="muted", rc=clear_bkgd)
-    else:
-        clear_bkgd = {'axes.facecolor': 'none', 'figure.facecolor': 'none'}
-        sns.set(style='ticks', font_scale=font_scale,
-                palette="muted", rc=clear_bkgd)
-
-    # Increase by one to get last xtick included as well
-    num_intervals += 1
-
-    # Number of intervals to display.
-    # Later calculations add 2 to this number to pad it to align with the reversed axis
-    x_values = 1.0 - 1.0 / 10 ** np.arange(0, num_intervals + 2)
-
-    # Start with hard-coded lengths for 0,90,99
-    # Rest of array generated to display correct number of decimal places as precision increases
-    lengths = [1, 2, 2] + \
-        [int(v) + 1 for v in list(np.arange(3, num_intervals + 2))]
-
-    # Build the label string by trimming on the calculated lengths and appending %
-    labels = [str(100 * v)[0:l] + "%" for v, l in zip(x_values, lengths)]
-
-    fig, ax = plt.subplots()
-    # sns.set(rc={'figure.figsize': (10, 5)})
-    # Set x axis to log scale
-    ax.set_xscale('log')
-    # Invert x axis
-    plt.gca().invert_xaxis()
-    # Labels have to be reversed because axis is reversed
-    ax.xaxis.set_ticklabels(labels[::-1])
-
-    # Cyclic iteraters for markers and linestyles
-    markers = itertools.cycle(['.', ',', 'o', 'v', '^', '<', '>', '1', '2',
-                               '3', '4', 's', 'p', '*', 'h', 'H', '+', 'x', 'D', 'd', '|', '_'])
-    linestyles = itertools.cycle(['-', '--', '-.', ':'])
-
-    # Plot distribution with different markers and lines each time
-    for key in percentiles_map:
-        if key in line_formats:
-            marker = line_formats[key][0]
-            linestyle = line_formats[key][1]
-            color = line_formats[key][2]
-            ax.plot([100.0 - v for v in percentages_map[key]], percentiles_map[key], marker=marker,
-                    linestyle=linestyle, color=color, label=key, alpha=0.7)
-        else:
-            ax.plot([100.0 - v for v in percentages_map[key]], percentiles_map[key], marker=next(markers),
-                    linestyle=next(linestyles), label=key, alpha=0.7)
-
-    # Grid lines
-    # Major lines (every 90%, 99%, 99.9%, etc.)
-    ax.grid(True, linewidth=0.5, zorder=5)
-    # Minor lines (10%, 20%,..., 80%, 91%, 92%,...,98%, etc.)
-    ax.grid(True, which='minor', linewidth=0.5,
-            linestyle=':')
-
-    # Make y axis log scale
-    if (y_log):
-        ax.set_yscale('log')
-
-    # Set y axis label
-    ax.set_ylabel(y_axis_label)
-    # Set x axis label
-    ax.set_xlabel(x_axis_label)
-    # Set title
-    ax.set_title(title)
-
-    # Put a legend to the right of the plot
-    lg = ax.legend(loc='center left', bbox_to_anchor=(
-        1.0, 0.5))
-
-    sns.despine(fig=fig)
-
-    fig.savefig(filename, dpi=600, bbox_extra_artists=(
-        lg,), bbox_inches='tight', format='png')
+        sink: QuantileSketch, HdrHistogram or WindowedHistograms
+    Returns: True if any value was added to the sink
+    """
+    if isinstance(sink, WindowedHistograms):
+        return bool(sink.histograms)
+    if isinstance(sink, HdrHistogram):
+        return sink.total_count > 0
+    return sink.count > 0
 
 
 if __name__ == "__main__":
@@ -0,0 +1,226 @@
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, the peak memory of spans is unknown there unless it is traced
+    resource = None
+
+# Profiler that is currently recording, spans are not recorded if None
+active = None
+
+
+def peak_rss():
+    """
+    Returns:
+        Peak resident set size of the process so far in bytes, or None if unknown
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Profiler:
+    """
+    Records the wall time, rows, bytes and peak memory of the stages of the pipeline as (nested) spans.
+    By default the peak memory of a span is the peak resident set size of the process when the span ends,
+    which is free to measure but never goes down again. With trace_memory it is the peak of the memory allocated
+    through Python (including numpy arrays) during the span itself, tracked with tracemalloc,
+    which slows down allocation heavy code such as imports and plotting considerably.
+    """
+
+    def __init__(self, trace_memory=False):
+        """
+        Args:
+            trace_memory: Whether to trace the peak memory allocated during every span with tracemalloc
+        """
+        self.memory = trace_memory
+        # List of dicts with stage, label, start and duration (seconds), rows, bytes, peak_memory and depth
+        self.spans = []
+        self._stack = []
+        self._origin = time.perf_counter()
+        self._started_tracing = False
+
+    def start(self):
+        """
+        Makes this the active profiler, so the spans of the pipeline are recorded in it
+        """
+        global active
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._origin = time.perf_counter()
+        active = self
+
+    def stop(self):
+        """
+        Stops recording
+        """
+        global active
+        if active is self:
+            active = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextlib.contextmanager
+    def span(self, stage, label=None, rows=None, nbytes=None):
+        """
+        Records a span around a block of code
+        Args:
+            stage: Name of the stage, e.g. 'parse' or 'percentiles'
+            label: Optional series label, file or function name the span belongs to
+            rows: Optional amount of rows processed, can also be set on the yielded dict
+            nbytes: Optional amount of bytes processed, can also be set on the yielded dict
+        Yields:
+            Dict of the span, 'rows' and 'bytes' can be updated inside the block
+        """
+        record = {'stage': stage, 'label': label, 'rows': rows, 'bytes': nbytes,
+                  'peak_memory': None, 'depth': len(self._stack)}
+        tracing = self.memory and tracemalloc.is_tracing()
+        if tracing:
+            # Resetting the peak loses the peak of the enclosing span so far, so it is kept on the stack
+            if self._stack:
+                self._stack[-1]['_peak'] = max(self._stack[-1]['_peak'], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            record['_peak'] = tracemalloc.get_traced_memory()[0]
+        self._stack.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['duration'] = time.perf_counter() - start
+            record['start'] = start - self._origin
+            self._stack.pop()
+            peak = record.pop('_peak', None)
+            if tracing and tracemalloc.is_tracing():
+                record['peak_memory'] = max(peak, tracemalloc.get_traced_memory()[1])
+                if self._stack:
+                    self._stack[-1]['_peak'] = max(self._stack[-1]['_peak'], record['peak_memory'])
+            elif not self.memory:
+                record['peak_memory'] = peak_rss()
+            self.spans.append(record)
+
+    def summary(self):
+        """
+        Returns:
+            List of dicts per (stage, label) in order of first appearance, with the amount of spans (count),
+            total wall time (seconds), rows, bytes, rows_per_second, bytes_per_second and peak_memory
+        """
+        groups = {}
+        for record in sorted(self.spans, key=lambda record: record['start']):
+            key = (record['stage'], record['label'])
+            group = groups.setdefault(key, {'stage': record['stage'], 'label': record['label'], 'count': 0,
+                                            'seconds': 0.0, 'rows': None, 'bytes': None, 'peak_memory': None})
+            group['count'] += 1
+            group['seconds'] += record['duration']
+            for field in ('rows', 'bytes'):
+                if record[field] is not None:
+                    group[field] = (group[field] or 0) + record[field]
+            if record['peak_memory'] is not None:
+                group['peak_memory'] = max(group['peak_memory'] or 0, record['peak_memory'])
+        for group in groups.values():
+            seconds = max(group['seconds'], 1e-9)
+            group['rows_per_second'] = None if group['rows'] is None else group['rows'] / seconds
+            group['bytes_per_second'] = None if group['bytes'] is None else group['bytes'] / seconds
+        return list(groups.values())
+
+    def format_summary(self):
+        """
+        Returns:
+            The summary (see summary) as a text table
+        """
+        def number(value, scale=1.0, digits=1):
+            return '' if value is None else f'{value / scale:.{digits}f}'
+
+        header = f"{'stage':<12} {'label':<40} {'count':>5} {'time (s)':>9} {'rows':>12} {'MB':>9} " \
+                 f"{'Mrows/s':>8} {'MB/s':>8} {'peak MB':>8}"
+        lines = [header, '-' * len(header)]
+        for group in self.summary():
+            label = '' if group['label'] is None else str(group['label'])
+            if len(label) > 40:
+                label = '...' + label[-37:]
+            lines.append(f"{group['stage']:<12} {label:<40} {group['count']:>5} {group['seconds']:>9.3f} "
+                         f"{number(group['rows'], digits=0):>12} {number(group['bytes'], 1e6):>9} "
+                         f"{number(group['rows_per_second'], 1e6, 2):>8} {number(group['bytes_per_second'], 1e6):>8} "
+                         f"{number(group['peak_memory'], 1e6):>8}")
+        return '\n'.join(lines)
+
+    def write_json(self, filename):
+        """
+        Writes the spans and the summary as JSON
+        Args:
+            filename: Name of the .json file
+        """
+        with open(filename, 'w') as f:
+            json.dump({'spans': sorted(self.spans, key=lambda record: record['start']),
+                       'summary': self.summary()}, f, indent=2, default=str)
+
+    def write_chrome_trace(self, filename):
+        """
+        Writes the spans in the Chrome trace event format, which chrome://tracing and Perfetto can open
+        Args:
+            filename: Name of the trace file
+        """
+        events = []
+        for record in self.spans:
+            name = record['stage'] if record['label'] is None else f"{record['stage']} {record['label']}"
+            events.append({'name': name, 'cat': record['stage'], 'ph': 'X',
+                           'ts': record['start'] * 1e6, 'dur': record['duration'] * 1e6,
+                           'pid': os.getpid(), 'tid': threading.get_ident(),
+                           'args': {field: record[field] for field in ('rows', 'bytes', 'peak_memory')
+                                    if record[field] is not None}})
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': sorted(events, key=lambda event: event['ts']),
+                       'displayTimeUnit': 'ms'}, f)
+
+
+def span(stage, label=None, rows=None, nbytes=None):
+    """
+    Records a span in the active profiler, does nothing if no profiler is active.
+    Configs can use it around their own code, e.g. `with span('my stage', 'my label') as s: ...`
+    Args:
+        stage, label, rows, nbytes: See Profiler.span
+    Returns:
+        Context manager that yields the dict of the span
+    """
+    if active is None:
+        # The yielded dict can still be updated, it is just not recorded
+        return contextlib.nullcontext({'stage': stage, 'label': label, 'rows': rows, 'bytes': nbytes})
+    return active.span(stage, label, rows, nbytes)
+
+
+def timed(name=None, stage='custom'):
+    """
+    Decorator that records every call of a function as a span in the active profiler,
+    e.g. for custom preprocessing functions in a config or in customfunctions.py:
+
+        @timed('strip warmup')
+        def strip_warmup(column): ...
+
+    The amount of rows is taken from the length of the first argument if it has one.
+    Args:
+        name: Label of the spans, defaults to the name of the function
+        stage: Stage of the spans
+    """
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if active is None:
+                return func(*args, **kwargs)
+            rows = len(args[0]) if args and hasattr(args[0], '__len__') else None
+            with active.span(stage, label, rows):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
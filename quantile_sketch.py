@@ -0,0 +1,171 @@
+import math
+
+import numpy as np
+
+
+class LogBucketStore:
+    """
+    Counts per logarithmic bucket index, grows to whatever index range is added
+    """
+
+    def __init__(self):
+        self.offset = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def add(self, indices):
+        """
+        Args:
+            indices: numpy int64 array of bucket indices, one per value
+        """
+        if len(indices) == 0:
+            return
+        low = int(indices.min())
+        high = int(indices.max())
+        self.grow(low, high)
+        self.counts += np.bincount(indices - self.offset,
+                                   minlength=len(self.counts))
+
+    def grow(self, low, high):
+        """
+        Makes sure the bucket indices low up to and including high can be stored
+        """
+        if len(self.counts) == 0:
+            self.offset = low
+            self.counts = np.zeros(high - low + 1, dtype=np.int64)
+            return
+        new_offset = min(low, self.offset)
+        new_end = max(high + 1, self.offset + len(self.counts))
+        if new_offset != self.offset or new_end != self.offset + len(self.counts):
+            counts = np.zeros(new_end - new_offset, dtype=np.int64)
+            start = self.offset - new_offset
+            counts[start:start + len(self.counts)] = self.counts
+            self.offset = new_offset
+            self.counts = counts
+
+    def merge(self, other):
+        """
+        Adds the counts of another store to this one
+        """
+        if len(other.counts) == 0:
+            return
+        self.grow(other.offset, other.offset + len(other.counts) - 1)
+        start = other.offset - self.offset
+        self.counts[start:start + len(other.counts)] += other.counts
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with a relative error guarantee (DDSketch).
+    Values are counted in logarithmic buckets, so every estimated percentile is within
+    relative_accuracy of the real value, also far into the tail.
+    Memory only depends on the range of the values, not on the amount of values.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        """
+        Args:
+            relative_accuracy: Maximum relative error of the estimated percentiles (range 0-1, exclusive)
+        """
+        if not 0.0 < relative_accuracy < 1.0:
+            raise ValueError(
+                f'relative_accuracy must be between 0 and 1, got {relative_accuracy}')
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1.0 + relative_accuracy) / (1.0 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = LogBucketStore()
+        # Negative values are stored by their absolute value
+        self.negative = LogBucketStore()
+        self.zero_count = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _indices(self, values):
+        return np.ceil(np.log(values) / self._log_gamma).astype(np.int64)
+
+    def add(self, values):
+        """
+        Adds values to the sketch
+        Args:
+            values: numpy array (or chunk of a column) of values
+        """
+        values = np.asarray(values, dtype=np.float64).reshape(-1)
+        if len(values) == 0:
+            return
+        if np.isnan(values).any():
+            raise ValueError('Cannot add NaN values to a quantile sketch')
+        positive = values[values > 0]
+        negative = values[values < 0]
+        self.positive.add(self._indices(positive))
+        self.negative.add(self._indices(-negative))
+        self.zero_count += len(values) - len(positive) - len(negative)
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def merge(self, other):
+        """
+        Merges another sketch into this one, the result is the same as adding all values to one sketch
+        Args:
+            other: QuantileSketch with the same relative accuracy
+        """
+        if other.gamma != self.gamma:
+            raise ValueError(
+                'Cannot merge quantile sketches with a different relative accuracy')
+        self.positive.merge(other.positive)
+        self.negative.merge(other.negative)
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def _bucket_bounds(self):
+        """
+        Returns:
+            Tuple of lower bounds, upper bounds, and cumulative counts of all buckets in ascending value order
+        """
+        gamma = self.gamma
+        negative_indices = self.negative.offset + \
+            np.arange(len(self.negative.counts))
+        positive_indices = self.positive.offset + \
+            np.arange(len(self.positive.counts))
+        # Negative buckets in ascending order are the absolute value buckets in descending order
+        lows = np.concatenate((-gamma ** negative_indices[::-1], [0.0],
+                               gamma ** (positive_indices - 1)))
+        highs = np.concatenate((-gamma ** (negative_indices[::-1] - 1), [0.0],
+                                gamma ** positive_indices))
+        counts = np.concatenate((self.negative.counts[::-1], [self.zero_count],
+                                 self.positive.counts))
+        return lows, highs, np.cumsum(counts)
+
+    def percentiles(self, percentages):
+        """
+        Estimates the percentiles of all values added to the sketch
+        Args:
+            percentages: List of percentages (0-100) to estimate the percentiles for
+        Returns:
+            Tuple of 1. numpy array of the estimated percentiles,
+            2. numpy array of the relative error bound achieved for each estimate
+        """
+        if self.count == 0:
+            raise ValueError('Cannot get percentiles of an empty quantile sketch')
+        percentages = np.asarray(percentages, dtype=np.float64)
+        lows, highs, cumulative = self._bucket_bounds()
+
+        # Bucket that holds the value at the (lower) rank of each percentage
+        ranks = np.floor(percentages / 100.0 * (self.count - 1))
+        buckets = np.searchsorted(cumulative, ranks, side='right')
+        # The real value lies within the bucket and within the observed min and max
+        lows = np.clip(lows[buckets], self.min, self.max)
+        highs = np.clip(highs[buckets], self.min, self.max)
+
+        # Harmonic mean of the bounds has the same relative distance to both of them
+        with np.errstate(divide='ignore', invalid='ignore'):
+            estimates = np.where(lows * highs > 0,
+                                 2 * lows * highs / (lows + highs), 0.0)
+            # Relative to the real value, which is at worst one of the bounds
+            errors = np.where(estimates != 0,
+                              np.maximum((estimates - lows) / np.abs(lows),
+                                         (highs - estimates) / np.abs(highs)),
+                              0.0)
+        return estimates, errors
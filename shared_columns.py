@@ -0,0 +1,132 @@
+import atexit
+
+import numpy as np
+
+
+class SharedArray:
+    """
+    Picklable description of a numpy array that worker processes can attach to without copying it,
+    either a shared memory block or a memory mapped file (e.g. a converted .npy column)
+    """
+
+    def __init__(self, shape, dtype, name=None, filename=None, offset=0):
+        """
+        Args:
+            shape: Shape of the array
+            dtype: numpy dtype of the array
+            name: Name of the shared memory block, None for a memory mapped file
+            filename: Name of the memory mapped file
+            offset: Byte offset of the array in the memory mapped file
+        """
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.name = name
+        self.filename = filename
+        self.offset = offset
+
+
+class SharedColumns:
+    """
+    Owner of the shared memory blocks of loaded columns, so worker processes can read them by name instead of
+    getting a pickled copy each. Blocks are unlinked when the owner is closed, at exit of this process,
+    or, if this process crashes, by the resource tracker of multiprocessing.
+    """
+
+    def __init__(self):
+        self.blocks = []
+        atexit.register(self.close)
+
+    def share(self, array):
+        """
+        Copies an array into a new shared memory block, memory mapped arrays are shared through their file instead
+        Args:
+            array: numpy array
+        Returns:
+            SharedArray that workers can pass to attach
+        """
+        if isinstance(array, np.memmap) and array.filename is not None and array.flags.c_contiguous:
+            return SharedArray(array.shape, array.dtype, filename=array.filename, offset=array.offset)
+        # Imported here so startup doesn't pay for multiprocessing
+        from multiprocessing import shared_memory
+        array = np.ascontiguousarray(array)
+        # Zero sized blocks are not allowed
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self.blocks.append(block)
+        np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+        return SharedArray(array.shape, array.dtype, name=block.name)
+
+    def share_columns(self, columns):
+        """
+        Moves loaded columns into shared memory, the arrays in the dict are replaced by read only views of their block
+        so the original arrays can be freed. The views must be gone before the blocks are closed.
+        Args:
+            columns: Dict where key = tuple of (csv filename, column), value = numpy array (see load_columns)
+        Returns:
+            Dict with the same keys, value = SharedArray
+        """
+        shared_columns = {}
+        for key, array in columns.items():
+            shared_columns[key] = self.share(array)
+            if shared_columns[key].name is not None:
+                view = np.ndarray(array.shape, array.dtype, buffer=self.blocks[-1].buf)
+                view.flags.writeable = False
+                columns[key] = view
+        return shared_columns
+
+    def close(self):
+        """
+        Closes and unlinks all blocks, workers that are still attached keep their mapping until they detach
+        """
+        while self.blocks:
+            block = self.blocks.pop()
+            try:
+                block.close()
+            except BufferError:
+                # A view of the block is still alive, its mapping is released once it is garbage collected
+                pass
+            block.unlink()
+        atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def attach(shared):
+    """
+    Attaches to a shared array in a worker process
+    Args:
+        shared: SharedArray
+    Returns:
+        Tuple of 1. read only numpy array, 2. shared memory block to pass to detach, or None for a memory mapped file
+    """
+    if shared.name is None:
+        return np.memmap(shared.filename, shared.dtype, 'r', shared.offset, shared.shape), None
+    from multiprocessing import shared_memory
+    try:
+        # The owner unlinks the block, so the worker must not track it (Python 3.13+)
+        block = shared_memory.SharedMemory(shared.name, track=False)
+    except TypeError:
+        block = shared_memory.SharedMemory(shared.name)
+    array = np.ndarray(shared.shape, shared.dtype, buffer=block.buf)
+    array.flags.writeable = False
+    return array, block
+
+
+def detach(blocks):
+    """
+    Closes the shared memory blocks of a worker, arrays attached to them must not be used afterwards
+    Args:
+        blocks: List of shared memory blocks returned by attach (None values are skipped)
+    """
+    for block in blocks:
+        if block is None:
+            continue
+        try:
+            block.close()
+        except BufferError:
+            # An array derived from the block (e.g. a view returned by a preprocessing function) is still alive,
+            # the mapping is released once it is garbage collected
+            pass
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from customfunctions import avg
+from prettypercentiles import combine
+
+SHORT = np.array([3, 1, 2], dtype=np.uint32)
+LONG = np.array([1, 5, 1, 7, 9], dtype=np.uint32)
+
+
+@pytest.mark.parametrize('func, expected', [
+    (sum, [4, 6, 3]),
+    (max, [3, 5, 2]),
+    (min, [1, 1, 1]),
+    (avg, [2, 3, 1.5]),
+    (lambda elements: elements[0] * 10 + elements[1], [31, 15, 21]),
+])
+def test_combine_cuts_to_shortest_column(func, expected):
+    np.testing.assert_array_equal(combine(func, SHORT, LONG), expected)
+    assert len(combine(func, LONG, SHORT)) == len(SHORT)
+
+
+def test_combine_sums_integers_in_64_bits():
+    column = np.array([2 ** 32 - 1], dtype=np.uint32)
+    result = combine(sum, column, column)
+    assert result.dtype == np.uint64
+    np.testing.assert_array_equal(result, [2 ** 33 - 2])
@@ -0,0 +1,93 @@
+import base64
+
+import numpy as np
+import pytest
+
+from hdr_histogram import HdrHistogram, decode_histogram, iter_hlog
+
+# Compressed histograms with a single value of 100, 200, ... 600, written by the HdrHistogram library
+INTERVALS = [
+    'HISTFAAAACJ4nJNpmSzMwMDAzAABMJoRRFybvITB/gNE4DgjEwBhNAVU',
+    'HISTFAAAACJ4nJNpmSzMwMDAzAABMJoRRFybvITB/gNEoJ+ZCQBgkAUe',
+    'HISTFAAAACJ4nJNpmSzMwMDAzAABMJoRRFybvITB/gNE4DoLEwBhagVn',
+    'HISTFAAAACJ4nJNpmSzMwMDAzAABMJoRRFybvITB/gNEYD4bEwBgxgUx',
+    'HISTFAAAACJ4nJNpmSzMwMDAzAABMJoRRFybvITB/gNE4Dk7EwBhoAV6',
+    'HISTFAAAACJ4nJNpmSzMwMDAzAABMJoRRFybvITB/gNEYD0nEwBg/AVE',
+]
+
+EPOCH = 1700000000.0
+
+# 1..1000, 990 values spread over 1000..250999, 1234567, 7654321 and 98765432 three times each and 5
+RECORDED = np.concatenate((np.arange(1, 1001), np.arange(1, 991) * 1037 % 250000 + 1000,
+                           [1234567, 7654321, 98765432] * 3, [5]))
+
+HISTOGRAM_PERCENTAGES = [0.0, 10.0, 25.0, 50.0, 75.0, 90.0, 99.0, 99.5, 99.6, 99.9, 100.0]
+
+# RECORDED encoded by the HdrHistogram library with 3 and 2 significant digits,
+# and its getValueAtPercentile at HISTOGRAM_PERCENTAGES
+ENCODED = {
+    3: 'HISTFAAAAP94nJNpmSzMwMCZygABzFCaEURcm7yEwf4DVIAJCFiYRsEoGAXDGfznYlrMiEAnWZn8mQLBeC8rlOHOdJ+JSZVJHQzvMgEJVQQTwoEy'
+       '1ZlEmdYyMgkyCYMxmAnhAJnCUA5cgSDTekIKoKLsQBgKxJxwFoQNYYHYMBY7UzicFQpVT7xehI54KCseqjoeqjYeKh/JxMjEDMT6YJKZSReIIXxG'
+       'MEsXKq4/SNRR23xZJiAFjG1QPQEhxZlAQqIwkg6yIHGEJFh4aEmSFgD8wPqYE1gpwzA3sHrmhGGwHDImTR03Cx5lyEbRShmF7qeOOnp4FIinq7Ct'
+       '1mJbbcUGALrvQ3A=',
+    2: 'HISTFAAAALp4nOVSwQ3CMAxMrq7TPlGesECnYArEQmzQEcoGDMAWzMEI2E5o00qIik8fnHNnJ7ZTqc7h0kfnaO8SkL1XefRXd3zmAwgIfwvaGM1m'
+       'wM1jJxaFZwSzFqccBXSo4I0apbgzfZ+lbNTfmJw8pmg6OT8m5zUkX0CWlpQgo0yk1QcZChkLjVqUSVSNC7xYdVMzqsUqOz70aasV+2aFMSabj7ZI'
+       '8Kqrltd9nyEXOt/8BmnGnXioeQj8At8aGrE=',
+}
+VALUES_AT_PERCENTAGES = {
+    3: [1, 199, 499, 999, 124159, 201983, 248703, 250879, 1234943, 98828287, 98828287],
+    2: [1, 199, 499, 999, 124415, 202751, 248831, 250879, 1236991, 99090431, 99090431],
+}
+
+
+@pytest.mark.parametrize('significant_digits', [3, 2])
+def test_decode_histogram(significant_digits):
+    histogram = decode_histogram(base64.b64decode(ENCODED[significant_digits]))
+    assert histogram.total_count == len(RECORDED)
+    values, _ = histogram.integer_percentiles(HISTOGRAM_PERCENTAGES)
+    np.testing.assert_array_equal(values, VALUES_AT_PERCENTAGES[significant_digits])
+
+
+@pytest.mark.parametrize('significant_digits', [3, 2])
+def test_integer_percentiles(significant_digits):
+    histogram = HdrHistogram(significant_digits)
+    histogram.add_integers(RECORDED)
+    values, lowest = histogram.integer_percentiles(HISTOGRAM_PERCENTAGES)
+    np.testing.assert_array_equal(values, VALUES_AT_PERCENTAGES[significant_digits])
+    # Every value is within the precision of the recorded value at that percentage
+    expected = np.percentile(RECORDED, HISTOGRAM_PERCENTAGES, method='inverted_cdf')
+    assert np.all((lowest <= expected) & (expected <= values))
+    assert np.all(values - lowest <= values / 10 ** significant_digits * 2)
+
+
+def test_decode_histogram_unit_ratio():
+    histogram = decode_histogram(base64.b64decode(ENCODED[3]), unit_ratio=1000)
+    percentiles, _ = histogram.percentiles(HISTOGRAM_PERCENTAGES)
+    np.testing.assert_array_equal(percentiles, np.array(VALUES_AT_PERCENTAGES[3]) / 1000)
+
+
+def write_hlog(path, headers, first_timestamp):
+    lines = ['#[Histogram log format version 1.3]'] + headers + ['"StartTimestamp","Interval_Length",'
+                                                                 '"Interval_Max","Interval_Compressed_Histogram"']
+    lines += [f'{first_timestamp + i:.3f},1.000,{(i + 1) * 100 / 1000000:.3f},{encoded}'
+              for i, encoded in enumerate(INTERVALS)]
+    path.write_text('\n'.join(lines) + '\n')
+    return str(path)
+
+
+@pytest.mark.parametrize('headers, first_timestamp', [
+    # Relative timestamps
+    ([f'#[StartTime: {EPOCH:.3f} (seconds since epoch), Tue Nov 14 22:13:20 UTC 2023]'], 0.0),
+    ([], 0.0),
+    # Absolute timestamps
+    ([f'#[StartTime: {EPOCH:.3f} (seconds since epoch), Tue Nov 14 22:13:20 UTC 2023]'], EPOCH),
+    ([], EPOCH),
+    # Timestamps relative to the base time, the log starts a second after it
+    ([f'#[StartTime: {EPOCH + 1:.3f} (seconds since epoch)]', f'#[BaseTime: {EPOCH:.3f} (seconds since epoch)]'],
+     1.0),
+])
+def test_iter_hlog_window_is_relative_to_start_of_log(tmp_path, headers, first_timestamp):
+    filename = write_hlog(tmp_path / 'run.hlog', headers, first_timestamp)
+    maxima = [int(histogram.integer_percentiles([100.0])[0][0])
+              for histogram in iter_hlog(filename, start=3, end=5)]
+    assert maxima == [400, 500]
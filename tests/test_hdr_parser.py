@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+
+from hdr_parser import parse_hgrm
+
+EXAMPLE_HGRM = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            'data', 'hdrhistogram_example.hgrm')
+
+# Output of the regex based parse_hgrm that the table parser replaced, for the example file
+
+DEFAULT_LATENCIES = [
+    1.0, 1.0, 1.0, 1.0, 2.0, 2.0, 2.0, 3.0, 4.0, 6.0, 7.0, 8.0, 8.0, 9.0, 10.0, 10.0, 11.0, 12.0, 14.0, 16.0,
+    19.0, 19.0, 20.0, 21.0, 22.0, 23.0, 24.0, 25.0, 27.0, 30.0, 31.0, 31.0, 33.0, 34.0, 35.0]
+DEFAULT_PERCENTILES = [
+    10.0, 20.0, 30.0, 40.0, 50.0, 60.0, 70.0, 77.5, 85.0, 91.25, 92.5, 93.75, 94.375, 95.0, 95.625, 96.25,
+    96.875, 97.5, 98.125, 98.75, 99.296875, 99.375, 99.453125, 99.53125, 99.609375, 99.6875, 99.765625,
+    99.82421875, 99.8828125, 99.94140625, 99.951171875, 99.9609375, 99.970703125, 99.97802734380001,
+    99.9853515625]
+
+# lower=0.5, upper=0.999
+BOUNDED_LATENCIES = [
+    2.0, 2.0, 3.0, 4.0, 5.0, 8.0, 9.0, 10.0, 10.0, 11.0, 12.0, 14.0, 16.0, 19.0, 19.0, 20.0, 21.0, 22.0, 23.0,
+    24.0, 25.0, 27.0]
+BOUNDED_PERCENTILES = [
+    55.00000000000001, 65.0, 75.0, 82.5, 88.75, 94.375, 95.0, 95.625, 96.25, 96.875, 97.5, 98.125, 98.75,
+    99.296875, 99.375, 99.453125, 99.53125, 99.609375, 99.6875, 99.765625, 99.82421875, 99.8828125]
+
+# slack=0.1
+FINE_LATENCIES = [
+    1.0, 1.0, 1.0, 1.0, 2.0, 2.0, 2.0, 2.0, 2.0, 3.0, 3.0, 3.0, 4.0, 4.0, 5.0, 5.0, 6.0, 6.0, 7.0, 8.0, 8.0, 9.0,
+    10.0, 10.0, 11.0, 12.0, 12.0, 13.0, 14.0, 15.0, 15.0, 16.0, 17.0, 17.0, 18.0, 19.0, 19.0, 20.0, 21.0, 22.0,
+    22.0, 23.0, 23.0, 24.0, 25.0, 25.0, 26.0, 27.0, 27.0, 28.0, 28.0, 29.0, 30.0, 30.0, 31.0, 31.0, 31.0, 32.0,
+    33.0, 33.0, 34.0, 35.0, 35.0, 35.0, 36.0, 36.0, 37.0]
+FINE_PERCENTILES = [
+    10.0, 20.0, 30.0, 40.0, 50.0, 55.00000000000001, 60.0, 65.0, 70.0, 75.0, 77.5, 80.0, 82.5, 85.0, 87.5,
+    88.75, 90.0, 91.25, 92.5, 93.75, 94.375, 95.0, 95.625, 96.25, 96.875, 97.1875, 97.5, 97.8125, 98.125,
+    98.4375, 98.59375, 98.75, 98.90625, 99.0625, 99.21875, 99.296875, 99.375, 99.453125, 99.53125, 99.609375,
+    99.6484375, 99.6875, 99.7265625, 99.765625, 99.8046875, 99.82421875, 99.84375, 99.86328125, 99.8828125,
+    99.90234375, 99.912109375, 99.921875, 99.931640625, 99.94140625, 99.951171875, 99.9560546875, 99.9609375,
+    99.9658203125, 99.970703125, 99.9755859375, 99.97802734380001, 99.98046875, 99.9829101563, 99.9853515625,
+    99.98779296880001, 99.9890136719, 99.990234375]
+
+
+def test_parse_hgrm_defaults():
+    latencies, percentiles = parse_hgrm(EXAMPLE_HGRM)
+    np.testing.assert_array_equal(latencies, DEFAULT_LATENCIES)
+    np.testing.assert_array_equal(percentiles, DEFAULT_PERCENTILES)
+
+
+def test_parse_hgrm_bounds():
+    latencies, percentiles = parse_hgrm(EXAMPLE_HGRM, lower=0.5, upper=0.999)
+    np.testing.assert_array_equal(latencies, BOUNDED_LATENCIES)
+    np.testing.assert_array_equal(percentiles, BOUNDED_PERCENTILES)
+
+
+def test_parse_hgrm_slack():
+    latencies, percentiles = parse_hgrm(EXAMPLE_HGRM, slack=0.1)
+    np.testing.assert_array_equal(latencies, FINE_LATENCIES)
+    np.testing.assert_array_equal(percentiles, FINE_PERCENTILES)
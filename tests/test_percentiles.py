@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from prettypercentiles import get_percentiles, get_sample_points, partition_ranks
+
+PERCENTAGES = np.concatenate(([0.0, 0.1, 1.0, 25.0, 50.0, 99.0, 99.99, 100.0], get_sample_points(5)))
+
+# Around 4096 partition_ranks switches from sorting to partitioning
+SIZES = [1, 2, 3, 4095, 4096, 4097, 10000, 100003]
+
+
+@pytest.mark.parametrize('n', SIZES)
+def test_get_percentiles_matches_numpy(n):
+    values = np.random.default_rng(n).lognormal(3.0, 1.0, n)
+    np.testing.assert_array_equal(get_percentiles(values, PERCENTAGES), np.percentile(values, PERCENTAGES))
+
+
+@pytest.mark.parametrize('n', SIZES)
+def test_get_percentiles_duplicates(n):
+    values = np.random.default_rng(n).integers(0, 5, n).astype(np.float64)
+    np.testing.assert_array_equal(get_percentiles(values, PERCENTAGES), np.percentile(values, PERCENTAGES))
+
+
+@pytest.mark.parametrize('dtype', [np.uint8, np.int16, np.uint32, np.int64, np.uint64])
+@pytest.mark.parametrize('n', [1, 2, 4097, 100003])
+def test_get_percentiles_integer_dtypes(dtype, n):
+    # Percentiles are interpolated in float64, so integers are exact up to 2^53
+    high = min(np.iinfo(dtype).max // 2, 2 ** 53)
+    values = np.random.default_rng(n).integers(0, high, n, dtype=dtype)
+    np.testing.assert_array_equal(get_percentiles(values, PERCENTAGES), np.percentile(values, PERCENTAGES))
+
+
+def test_get_percentiles_list_input():
+    values = [5.0, 1.0, 4.0, 2.0, 3.0]
+    np.testing.assert_array_equal(get_percentiles(values, PERCENTAGES), np.percentile(values, PERCENTAGES))
+    assert values == [5.0, 1.0, 4.0, 2.0, 3.0]
+
+
+@pytest.mark.parametrize('n', [2, 4097, 100003])
+def test_get_percentiles_overwrite_input(n):
+    values = np.random.default_rng(n).lognormal(3.0, 1.0, n)
+    expected = np.percentile(values, PERCENTAGES)
+    original = values.copy()
+
+    np.testing.assert_array_equal(get_percentiles(values, PERCENTAGES), expected)
+    np.testing.assert_array_equal(values, original)
+
+    np.testing.assert_array_equal(get_percentiles(values, PERCENTAGES, overwrite_input=True), expected)
+    # Only reordered in place
+    np.testing.assert_array_equal(np.sort(values), np.sort(original))
+
+
+def test_get_percentiles_empty():
+    with pytest.raises(ValueError):
+        get_percentiles(np.array([]), PERCENTAGES)
+
+
+@pytest.mark.parametrize('n, ranks', [
+    (1, [0]),
+    (4096, [0, 2047, 4095]),
+    (100003, [0, 50, 50001, 99000, 99990, 100001, 100002]),
+    (100003, []),
+])
+def test_partition_ranks(n, ranks):
+    values = np.random.default_rng(n).integers(0, 1000, n).astype(np.float64)
+    expected = np.sort(values)
+    ranks = np.array(ranks, dtype=np.intp)
+    partition_ranks(values, ranks)
+    np.testing.assert_array_equal(values[ranks], expected[ranks])
+    np.testing.assert_array_equal(np.sort(values), expected)